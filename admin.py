@@ -0,0 +1,232 @@
+import functools
+import hmac
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+import streamlit as st
+
+from cohort_analysis import GROUP_FIELDS
+from monitor import get_monitor
+from profiler import ENABLED as PROFILING_ENABLED, get_profiler
+from results_store import (
+    DEFAULT_DB_PATH, EXPORT_FORMATS, EXPORT_TABLES, day_start, get_results_store,
+    write_dataset
+)
+
+# The admin view is served by app.py itself (it has to share the process to
+# see the in-memory instrumentation) and is reached with ?admin=<token>.
+# Without RP_ADMIN_TOKEN set there is no admin view at all.
+ADMIN_TOKEN = os.environ.get("RP_ADMIN_TOKEN")
+
+# Seconds between refreshes of the live monitor.
+MONITOR_REFRESH = 2
+
+# Prepared exports are temporary files named EXPORT_PREFIX*. Streamlit does
+# not say when an admin session ends, so files older than this are removed
+# whenever a new export is prepared.
+EXPORT_PREFIX = "rp-export-"
+EXPORT_FILE_TTL = 3600
+
+logger = logging.getLogger(__name__)
+
+
+# ================= ACCESS =================
+
+def is_admin_request():
+
+    if not ADMIN_TOKEN:
+        return False
+
+    supplied = st.query_params.get("admin", "")
+    return hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+
+
+# ================= VIEW =================
+
+@st.fragment(run_every=MONITOR_REFRESH)
+def render_monitor():
+
+    # Reruns on its own every MONITOR_REFRESH seconds, reading only the
+    # running aggregates.
+
+    st.header("Live sessions")
+
+    snapshot = get_monitor().snapshot()
+
+    st.metric("Active participants", snapshot["active"])
+
+    rows = []
+    for stage, data in snapshot["stages"].items():
+        rows.append({
+            "Stage": stage,
+            "Active": data["active"],
+            "Mean trials done": data["mean_trials_done"],
+            "Median RT (s)": data["median_rt"],
+            "Timeout rate": data["timeout_rate"],
+            "Entered": data["entered"],
+            "Trials": data["trials"],
+            "Timeouts": data["timeouts"],
+        })
+
+    st.dataframe(rows, use_container_width=True)
+    st.caption(
+        "Median RT and timeout rate cover each test's most recent trials. "
+        "Only sessions served by this process are shown."
+    )
+
+    with st.expander(f"Participants ({snapshot['active']})"):
+        st.dataframe([
+            {
+                "Session": s["session_id"][:8],
+                "Stage": s["stage"],
+                "Trials done": s["trials_done"],
+                "Idle (s)": round(s["idle_s"]),
+            }
+            for s in snapshot["sessions"]
+        ], use_container_width=True)
+
+    with st.expander("Recent events"):
+        st.dataframe([
+            {
+                "Time": time.strftime("%H:%M:%S", time.localtime(e["at"])),
+                "Event": e["kind"],
+                "Session": e["session_id"][:8],
+                "Stage": e["stage"],
+                "Trial": e.get("trial"),
+                "RT (s)": e.get("rt"),
+            }
+            for e in snapshot["events"]
+        ], use_container_width=True)
+
+
+def _remove_stale_exports(now):
+    directory = tempfile.gettempdir()
+    for name in os.listdir(directory):
+        if not name.startswith(EXPORT_PREFIX):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(path) > EXPORT_FILE_TTL:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def render_export():
+
+    # The export is streamed to a temporary file chunk by chunk; the file is
+    # opened only when the download is clicked and handed to Streamlit as a
+    # file object.
+
+    st.header("Export data")
+
+    with st.form("export_form"):
+        table = st.selectbox("Records", EXPORT_TABLES)
+        fmt = st.selectbox("Format", EXPORT_FORMATS)
+        dates = st.date_input("Sessions started between", value=())
+        field = st.selectbox("Cohort", ["All participants", *GROUP_FIELDS])
+        value = st.text_input("Cohort value", help="e.g. Mobile for device")
+        prepare = st.form_submit_button("Prepare export")
+
+    if prepare:
+
+        # Include everything recorded so far by this process. If the writer
+        # is behind or failing, export what is on disk and say so.
+        try:
+            get_results_store().drain()
+        except (TimeoutError, sqlite3.Error) as e:
+            logger.error("Export started before all results were written: %s", e)
+            st.warning("Some recent records are not written yet and are missing from this export.")
+
+        previous = st.session_state.pop("admin_export", None)
+        if previous is not None and os.path.exists(previous[0]):
+            os.remove(previous[0])
+        _remove_stale_exports(time.time())
+
+        since = day_start(dates[0].isoformat()) if len(dates) > 0 else None
+        until = day_start(dates[-1].isoformat(), days_after=1) if len(dates) > 0 else None
+        cohort = {field: value} if field in GROUP_FIELDS and value else None
+
+        f = tempfile.NamedTemporaryFile("wb", prefix=EXPORT_PREFIX, suffix=f".{fmt}", delete=False)
+        written = None
+
+        try:
+            with f:
+                written = write_dataset(
+                    f, DEFAULT_DB_PATH, table=table, fmt=fmt,
+                    since=since, until=until, cohort=cohort
+                )
+        except ImportError as e:
+            st.error(str(e))
+        except sqlite3.Error as e:
+            st.error(f"The export failed: {e}")
+        finally:
+            # Whatever went wrong, no half-written file is left behind.
+            if written is None:
+                os.remove(f.name)
+
+        if written is not None:
+            st.session_state.admin_export = (f.name, f"{table}.{fmt}", written)
+
+    if "admin_export" in st.session_state:
+        path, file_name, written = st.session_state.admin_export
+
+        st.download_button(
+            f"Download {file_name} ({written / 1e6:.1f} MB)",
+            data=functools.partial(open, path, "rb"),
+            file_name=file_name,
+            mime="text/csv" if file_name.endswith(".csv") else "application/octet-stream",
+        )
+
+
+def render_profiler():
+
+    st.header("Rerun profiler")
+
+    if not PROFILING_ENABLED:
+        st.info("Profiling is off. Start the app with RP_PROFILE=1 to collect data.")
+        return
+
+    profiler = get_profiler()
+    snapshot = profiler.snapshot()
+
+    rows = []
+    for stage, data in sorted(snapshot["stages"].items()):
+        runs = data.get("runs", 0)
+        rows.append({
+            "Stage": stage,
+            "Runs": runs,
+            "Mean wall (ms)": 1000 * data.get("wall_seconds", 0.0) / runs if runs else None,
+            "p50 (ms)": _ms(data["recent_wall_seconds"]["0.5"]),
+            "p90 (ms)": _ms(data["recent_wall_seconds"]["0.9"]),
+            "p99 (ms)": _ms(data["recent_wall_seconds"]["0.99"]),
+            "st.image calls": data.get("image", 0),
+            "State mutations": data.get("state_mutations", 0),
+            "Test state writes": data.get("stage_state_writes", 0),
+        })
+
+    st.dataframe(rows, use_container_width=True)
+
+    fmt = st.query_params.get("format")
+
+    if fmt == "prometheus":
+        st.code(profiler.dump_prometheus(), language="text")
+    elif fmt == "json":
+        st.code(profiler.dump_json(), language="json")
+    else:
+        st.caption("Add &format=json or &format=prometheus to the URL for a text dump.")
+
+
+def _ms(seconds):
+    return None if seconds is None else 1000 * seconds
+
+
+def render_admin_view():
+
+    st.title("Study Administration")
+    render_monitor()
+    render_export()
+    render_profiler()
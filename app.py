@@ -1,17 +1,40 @@
 import streamlit as st
+import logging
+import sqlite3
 import time
+import uuid
 
-from math_test import run_math_test
-from stroop_test import run_stroop_test
-from mental_rotation_test import run_mental_rotation_test
+from admin import is_admin_request, render_admin_view
+from monitor import get_monitor
+from preload import start_preload
+from profiler import profile_run
+from question_bank import load_question_bank
+from results_store import get_results_store
+from state_backend import persist_session, restore_session
+from stimulus_cache import IMAGE_SETS, StimulusLoadError, check_stimuli, load_stimuli
 
 st.set_page_config(page_title="Cognitive Assessment Tool", layout="centered")
 
+logger = logging.getLogger(__name__)
+
+
+# =====================================================
+# ADMIN VIEW
+# =====================================================
+
+if is_admin_request():
+    render_admin_view()
+    st.stop()
+
 
 # =====================================================
 # CLOUD SAFE SESSION INITIALIZATION
 # =====================================================
 
+# A session reconnecting with its resume token, to this worker or another
+# one sharing the state backend (RP_STATE_BACKEND), picks up where it was.
+restore_session()
+
 if "current_stage" not in st.session_state:
     st.session_state.current_stage = "consent"
 
@@ -21,6 +44,40 @@ if "stage_lock" not in st.session_state:
 if "heartbeat" not in st.session_state:
     st.session_state.heartbeat = time.time()
 
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+# Every math pool and Stroop sequence this session sees is fixed by one
+# index into the precomputed question bank, so it can be audited later.
+if "bank_index" not in st.session_state:
+    st.session_state.bank_index = load_question_bank().random_index()
+
+persist_session()
+
+# Feeds the live view in the admin page: who is at which stage.
+get_monitor().observe(st.session_state.session_id, st.session_state.current_stage)
+
+
+# =====================================================
+# STIMULUS PRELOAD
+# =====================================================
+
+# Source images and prebuilt assets are checked once per process, so a
+# missing or corrupt file is reported here rather than midway through the
+# task; every variant is then built in the background and shared by all
+# sessions.
+
+def stop_for_stimuli(error):
+    st.error("The test materials could not be loaded. Please contact the study team.")
+    st.code(str(error))
+    st.stop()
+
+
+try:
+    check_stimuli(IMAGE_SETS)
+except StimulusLoadError as e:
+    stop_for_stimuli(e)
+
 
 # =====================================================
 # CONSENT + DEMOGRAPHICS PAGE
@@ -28,6 +85,8 @@ if "heartbeat" not in st.session_state:
 
 if st.session_state.current_stage == "consent":
 
+    start_preload()
+
     st.title("Cognitive Assessment Study")
 
     st.markdown("""
@@ -111,6 +170,13 @@ if st.session_state.current_stage == "consent":
             "prior_exposure": prior_exposure
         }
 
+        get_results_store().record_session(
+            st.session_state.session_id,
+            st.session_state.demographics,
+            bank_index=st.session_state.bank_index,
+            started_at=st.session_state.heartbeat
+        )
+
         st.session_state.stage_lock = False
         st.session_state.current_stage = "instructions"
 
@@ -149,14 +215,27 @@ elif st.session_state.current_stage == "instructions":
 # TEST ENGINE ROUTER
 # =====================================================
 
+# Engines are imported on first use (usually already warm from the
+# consent-page preload), so the consent page never waits for them.
+
 elif st.session_state.current_stage == "math":
-    run_math_test()
+    from math_test import run_math_test
+    with profile_run("math"):
+        run_math_test()
 
 elif st.session_state.current_stage == "stroop":
-    run_stroop_test()
+    from stroop_test import run_stroop_test
+    with profile_run("stroop"):
+        run_stroop_test()
 
 elif st.session_state.current_stage == "mental":
-    run_mental_rotation_test()
+    from mental_rotation_test import run_mental_rotation_test, stimulus_variant
+    try:
+        load_stimuli(IMAGE_SETS, stimulus_variant())
+    except StimulusLoadError as e:
+        stop_for_stimuli(e)
+    with profile_run("mental"):
+        run_mental_rotation_test()
 
 
 # =====================================================
@@ -177,4 +256,14 @@ elif st.session_state.current_stage == "final":
 
     st.success("You may now close this window.")
 
+    # Nothing of this session may still be waiting for the writer thread
+    # once the participant leaves. A failure is logged for the study team,
+    # not shown to the participant; the writer keeps retrying on its own.
+    if not st.session_state.get("results_drained"):
+        try:
+            get_results_store().drain()
+            st.session_state.results_drained = True
+        except (TimeoutError, sqlite3.Error) as e:
+            logger.error("Results of session %s not written yet: %s", st.session_state.session_id, e)
+
 
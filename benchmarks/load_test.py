@@ -0,0 +1,289 @@
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(BASE_DIR, "app.py")
+
+# Bots drive app.py through streamlit.testing.v1.AppTest. AppTest swaps a
+# process-global mock runtime on every run, so concurrent participants are
+# simulated with one worker process each: the numbers reflect CPU
+# contention between sessions on one machine, not GIL contention inside a
+# single server process.
+
+
+# ================= BOT =================
+
+class Bot:
+
+    def __init__(self, bot_id, seed, options):
+
+        from streamlit.testing.v1 import AppTest
+
+        self.rng = random.Random(seed)
+        self.options = options
+        self.run_latencies = []
+        self.stage_state_bytes = {}
+        self.timer_drift = []
+
+        self.at = AppTest.from_file(APP_PATH, default_timeout=options["timeout"])
+        self.at.session_state.bank_index = seed % options["bank_size"]
+
+        # mental_rotation_test shuffles with the global random module.
+        random.seed(seed)
+
+    # ---------- DRIVER ----------
+
+    def run(self):
+        start = time.perf_counter()
+        self.at.run()
+        self.run_latencies.append(time.perf_counter() - start)
+
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].value)
+
+    def click(self, label):
+        for button in self.at.button:
+            if button.label == label:
+                button.click()
+                self.run()
+                return
+        raise LookupError(f"No button labelled {label!r} in stage {self.stage}")
+
+    @property
+    def stage(self):
+        return self.at.session_state.current_stage
+
+    def measure_state(self):
+        size = 0
+        for key, value in self.at.session_state.items():
+            try:
+                size += len(pickle.dumps(value))
+            except Exception:
+                pass
+        self.stage_state_bytes[self.stage] = max(size, self.stage_state_bytes.get(self.stage, 0))
+
+    def wait_out(self, state_key, limit):
+
+        # Sleep until the deadline plus the same slack schedule_rerun adds,
+        # rerun as the client timer would, and record how late past the
+        # deadline the timeout had taken effect once the run finished.
+
+        from timing import RERUN_SLACK_MS, now_ns
+
+        deadline_ns = self.at.session_state[state_key].onset_ns + int(limit * 1e9)
+        time.sleep(max(0.0, (deadline_ns - now_ns()) / 1e9) + RERUN_SLACK_MS / 1000)
+        self.run()
+        self.timer_drift.append((now_ns() - deadline_ns) / 1e9 - RERUN_SLACK_MS / 1000)
+
+    # ---------- STAGES ----------
+
+    def consent(self):
+        self.run()
+        self.at.checkbox[0].check()
+        self.at.text_input[0].input(f"bot-{self.rng.randrange(10 ** 6)}")
+        self.click("Start Test")
+        self.measure_state()
+        self.click("Continue to Test")
+
+    def math(self):
+        import math_test
+
+        self.click("Start Test")
+
+        for _ in range(self.options["math_answers"]):
+            _, answer, _ = math_test.current_question(self.at.session_state.math_state)
+            if self.rng.random() > self.options["accuracy"]:
+                answer += 1
+            self.at.text_input[0].input(str(answer))
+            self.click("Submit")
+
+        self.measure_state()
+
+        # Skip the rest of the five minutes: move the start back past the
+        # deadline and rerun, as the scheduled wake-up would.
+        self.at.session_state.math_state.started_at -= math_test.TEST_DURATION
+        self.run()
+        self.click("Continue to Stroop Test")
+
+    def stroop(self):
+        import stroop_test
+
+        self.click("▶️ Start Test")
+
+        while self.at.session_state.stroop_state.trial < stroop_test.TOTAL_QUESTIONS:
+            if self.rng.random() < self.options["timeout_rate"]:
+                self.wait_out("stroop_state", stroop_test.TIME_LIMIT)
+                continue
+
+            state = self.at.session_state.stroop_state
+            _, color, _ = state.trials[state.trial]
+            if self.rng.random() > self.options["accuracy"]:
+                color = self.rng.choice(["red", "green", "blue", "yellow"])
+            self.click(color.upper())
+
+        self.measure_state()
+        self.click("Continue to Mental Rotation Test")
+
+    def mental(self):
+        import mental_rotation_test
+
+        self.run()
+
+        while self.at.session_state.mental_state.trial < mental_rotation_test.TOTAL_QUESTIONS:
+            if self.rng.random() < self.options["timeout_rate"]:
+                self.wait_out("mental_state", mental_rotation_test.QUESTION_TIME_LIMIT)
+                continue
+
+            state = self.at.session_state.mental_state
+            options = state.options[state.trial]
+            correct = 0 if options[0]["correct"] else 1
+            pick = correct if self.rng.random() <= self.options["accuracy"] else 1 - correct
+            self.click("Option A" if pick == 0 else "Option B")
+
+        self.measure_state()
+        self.click("Continue")
+
+    def complete(self):
+        self.consent()
+        self.math()
+        self.stroop()
+        self.mental()
+        self.measure_state()
+
+        return {
+            "run_latencies": self.run_latencies,
+            "state_bytes": self.stage_state_bytes,
+            "timer_drift": self.timer_drift,
+        }
+
+
+def run_bot(bot_id, seed, options):
+
+    sys.path.insert(0, BASE_DIR)
+    os.chdir(BASE_DIR)
+
+    # Shrink per-trial limits so timeouts can be exercised in a short run.
+    import mental_rotation_test
+    import stroop_test
+    stroop_test.TIME_LIMIT = options["stroop_limit"]
+    mental_rotation_test.QUESTION_TIME_LIMIT = options["mrt_limit"]
+
+    return Bot(bot_id, seed, options).complete()
+
+
+# ================= REPORT =================
+
+def percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {
+        f"p{p}": ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+        for p in points
+    }
+
+
+def summarise(results, wall_time):
+
+    latencies = [x for r in results for x in r["run_latencies"]]
+    drift = [x for r in results for x in r["timer_drift"]]
+
+    stages = sorted({stage for r in results for stage in r["state_bytes"]})
+
+    return {
+        "sessions": len(results),
+        "wall_time_s": wall_time,
+        "reruns": len(latencies),
+        "reruns_per_s": len(latencies) / wall_time if wall_time else None,
+        "rerun_latency_s": {
+            "mean": statistics.fmean(latencies) if latencies else None,
+            **percentiles(latencies),
+        },
+        "state_bytes_per_session": {
+            stage: max(r["state_bytes"].get(stage, 0) for r in results) for stage in stages
+        },
+        "timer_drift_s": {
+            "count": len(drift),
+            "mean": statistics.fmean(drift) if drift else None,
+            **percentiles(drift),
+        },
+    }
+
+
+# ================= COMMAND LINE =================
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Drive simulated participants through app.py and report rerun latency."
+    )
+    parser.add_argument("--sessions", type=int, default=8, help="total participants")
+    parser.add_argument("--concurrency", type=int, default=4, help="participants running at once")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--math-answers", type=int, default=20)
+    parser.add_argument("--accuracy", type=float, default=0.8)
+    parser.add_argument("--timeout-rate", type=float, default=0.1)
+    parser.add_argument("--stroop-limit", type=float, default=0.5, help="seconds per Stroop trial")
+    parser.add_argument("--mrt-limit", type=float, default=0.5, help="seconds per rotation trial")
+    parser.add_argument("--out", default=None, help="write the JSON report here")
+
+    args = parser.parse_args()
+
+    # Results go to a throwaway database unless one is given explicitly.
+    os.environ.setdefault(
+        "RP_RESULTS_DB", os.path.join(tempfile.mkdtemp(prefix="rp-load-"), "results.db")
+    )
+    # Session state is not persisted either, unless a backend is given.
+    os.environ.setdefault("RP_STATE_BACKEND", "none")
+
+    sys.path.insert(0, BASE_DIR)
+    from question_bank import load_question_bank
+
+    options = {
+        "timeout": 60,
+        "bank_size": len(load_question_bank()),
+        "math_answers": args.math_answers,
+        "accuracy": args.accuracy,
+        "timeout_rate": args.timeout_rate,
+        "stroop_limit": args.stroop_limit,
+        "mrt_limit": args.mrt_limit,
+    }
+
+    start = time.perf_counter()
+
+    # A fresh process per participant: AppTest replaces sys.modules["__main__"]
+    # while a script runs, and bots patch module constants.
+    pool = ProcessPoolExecutor(
+        max_workers=args.concurrency,
+        mp_context=multiprocessing.get_context("spawn"),
+        max_tasks_per_child=1,
+    )
+
+    with pool:
+        futures = [
+            pool.submit(run_bot, i, args.seed + i, options) for i in range(args.sessions)
+        ]
+        results = [f.result() for f in futures]
+
+    report = summarise(results, time.perf_counter() - start)
+    report["config"] = {**vars(args), "results_db": os.environ["RP_RESULTS_DB"]}
+
+    text = json.dumps(report, indent=2)
+    print(text)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
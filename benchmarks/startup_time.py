@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(BASE_DIR, "app.py")
+
+# Cold start, measured as the first script run of app.py (the consent page)
+# in a brand-new interpreter, so nothing is cached in sys.modules or in
+# st.cache_resource. "lazy" is app.py as it is; "eager" imports the three
+# test engines up front first, the way app.py's top-level imports used to.
+
+ENGINE_MODULES = ("math_test", "stroop_test", "mental_rotation_test")
+
+
+# ================= CHILD =================
+
+def measure(mode):
+
+    sys.path.insert(0, BASE_DIR)
+    os.chdir(BASE_DIR)
+
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+
+    start = time.perf_counter()
+
+    if mode == "eager":
+        for name in ENGINE_MODULES:
+            __import__(name)
+
+    at.run()
+    first_paint = time.perf_counter() - start
+
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+    return {"first_paint_s": first_paint}
+
+
+# ================= REPORT =================
+
+def run_child(mode):
+
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def summarise(samples):
+    times = [s["first_paint_s"] for s in samples]
+    return {
+        "runs": len(times),
+        "mean_s": statistics.fmean(times),
+        "median_s": statistics.median(times),
+        "min_s": min(times),
+    }
+
+
+# ================= COMMAND LINE =================
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Compare cold first-run time of app.py with lazy and eager engine imports."
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--out", default=None, help="write the JSON report here")
+    parser.add_argument("--child", choices=("lazy", "eager"), help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child)))
+        return
+
+    os.environ.setdefault(
+        "RP_RESULTS_DB", os.path.join(tempfile.mkdtemp(prefix="rp-startup-"), "results.db")
+    )
+    # Session state is not persisted either, unless a backend is given.
+    os.environ.setdefault("RP_STATE_BACKEND", "none")
+
+    # Interleaved, so drift in machine load hits both modes alike.
+    samples = {"lazy": [], "eager": []}
+    for _ in range(args.repeats):
+        for mode in samples:
+            samples[mode].append(run_child(mode))
+
+    report = {mode: summarise(s) for mode, s in samples.items()}
+    report["speedup_s"] = report["eager"]["median_s"] - report["lazy"]["median_s"]
+    report["config"] = {"repeats": args.repeats}
+
+    text = json.dumps(report, indent=2)
+    print(text)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
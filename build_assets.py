@@ -0,0 +1,125 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from stimulus_cache import (
+    ASSET_MANIFEST, BASE_DIR, DEFAULT_ASSET_DIR, IMAGE_SETS, VARIANT_WIDTHS,
+    render_stimulus, variant_size
+)
+
+# Writes every stimulus at each VARIANT_WIDTHS size to <out>/<variant>/ and
+# a manifest with sizes and SHA-256 checksums. stimulus_cache serves these
+# files when they exist; the output is a build artefact and not committed.
+
+
+# ================= BUILD =================
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def build_assets(out_dir=DEFAULT_ASSET_DIR, image_sets=IMAGE_SETS):
+
+    images = {}
+
+    for variant in VARIANT_WIDTHS:
+        os.makedirs(os.path.join(out_dir, variant), exist_ok=True)
+
+        for image_set in image_sets:
+            width, height = variant_size(image_set, variant)
+
+            for path in image_set:
+                data = render_stimulus(path, (width, height))
+                name = os.path.join(variant, os.path.basename(path))
+
+                with open(os.path.join(out_dir, name), "wb") as f:
+                    f.write(data)
+
+                with open(os.path.join(BASE_DIR, path), "rb") as f:
+                    source = f.read()
+
+                entry = images.setdefault(path, {"source_sha256": _sha256(source)})
+                entry[variant] = {
+                    "file": name,
+                    "width": width,
+                    "height": height,
+                    "bytes": len(data),
+                    "sha256": _sha256(data),
+                }
+
+    manifest = {
+        "built_at": time.time(),
+        "variants": VARIANT_WIDTHS,
+        "images": images,
+    }
+
+    with open(os.path.join(out_dir, ASSET_MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def check_assets(asset_dir=DEFAULT_ASSET_DIR):
+
+    # Problems with the built assets: missing or altered files, and sources
+    # changed since the build.
+
+    with open(os.path.join(asset_dir, ASSET_MANIFEST)) as f:
+        manifest = json.load(f)
+
+    problems = []
+
+    for path, entry in manifest["images"].items():
+        try:
+            with open(os.path.join(BASE_DIR, path), "rb") as f:
+                if _sha256(f.read()) != entry["source_sha256"]:
+                    problems.append(f"{path}: source changed since the build")
+        except OSError as e:
+            problems.append(f"{path}: {e}")
+
+        for variant in manifest["variants"]:
+            built = entry[variant]
+            try:
+                with open(os.path.join(asset_dir, built["file"]), "rb") as f:
+                    if _sha256(f.read()) != built["sha256"]:
+                        problems.append(f"{built['file']}: checksum mismatch")
+            except OSError as e:
+                problems.append(f"{built['file']}: {e}")
+
+    return problems
+
+
+# ================= COMMAND LINE =================
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Build or verify the stimulus image variants.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="write every variant and the manifest")
+    build.add_argument("--out", default=DEFAULT_ASSET_DIR)
+
+    check = sub.add_parser("check", help="verify built files against the manifest")
+    check.add_argument("--path", default=DEFAULT_ASSET_DIR)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        manifest = build_assets(args.out)
+        for variant in manifest["variants"]:
+            total = sum(entry[variant]["bytes"] for entry in manifest["images"].values())
+            print(f"{variant}: {len(manifest['images'])} images, {total} bytes")
+
+    else:
+        problems = check_assets(args.path)
+        for problem in problems:
+            print(problem)
+        if problems:
+            raise SystemExit(1)
+        print("All assets match the manifest")
+
+
+if __name__ == "__main__":
+    main()
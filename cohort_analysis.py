@@ -0,0 +1,178 @@
+import argparse
+import csv
+import math
+import os
+import sqlite3
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from results_store import DEFAULT_DB_PATH
+from scoring import MATH_WEIGHTS, score_database
+
+# Demographic fields to break results down by. Name, home town and current
+# city are free text and are left out.
+GROUP_FIELDS = (
+    "age", "gender", "mother_language", "academic", "service",
+    "handedness", "device", "vision", "prior_exposure",
+)
+
+# The metrics the participant sees at the end of each test.
+METRICS = (
+    "math_numerical_score",
+    "math_weighted_accuracy",
+    "math_speed_efficiency",
+    "math_adaptive_staircase_score",
+    "math_adaptive_staircase_level",
+    "math_adaptive_reversals",
+    "stroop_error_rate",
+    "stroop_mean_rt",
+    "stroop_stroop_effect",
+    "mental_accuracy",
+    "mental_avg_time",
+    "mental_timed_out",
+)
+
+CHUNK_SIZE = 500
+
+
+# ================= STREAMING =================
+
+def iter_session_chunks(db_path, chunk_size=CHUNK_SIZE):
+
+    # Keyset pagination over the sessions table: only one chunk of
+    # (session_id, demographics) rows is ever held in memory.
+
+    conn = sqlite3.connect(db_path)
+    columns = ", ".join(GROUP_FIELDS)
+    last = ""
+
+    try:
+        while True:
+            rows = conn.execute(
+                f"SELECT session_id, {columns} FROM sessions "
+                f"WHERE session_id > ? ORDER BY session_id LIMIT ?",
+                (last, chunk_size)
+            ).fetchall()
+
+            if not rows:
+                return
+
+            yield rows
+            last = rows[-1][0]
+    finally:
+        conn.close()
+
+
+# ================= AGGREGATION =================
+
+# Partial aggregates are {(field, value, metric): [n, sum, sum_sq]}; they
+# merge by addition, so the result size depends only on the number of
+# groups, never on the number of sessions.
+
+def _accumulate(partial, key, value):
+    acc = partial.get(key)
+    if acc is None:
+        partial[key] = [1, value, value * value]
+    else:
+        acc[0] += 1
+        acc[1] += value
+        acc[2] += value * value
+
+
+def analyse_chunk(db_path, rows, weights=MATH_WEIGHTS):
+
+    session_ids = [row[0] for row in rows]
+    scores = score_database(db_path, weights, session_ids)
+
+    partial = {}
+
+    for session_id, *demographics in rows:
+        session_scores = scores.get(session_id)
+        if not session_scores:
+            continue
+
+        groups = [("all", "all")] + list(zip(GROUP_FIELDS, demographics))
+
+        for metric in METRICS:
+            value = session_scores.get(metric)
+            if value is None:
+                continue
+            for field, group in groups:
+                _accumulate(partial, (field, group, metric), value)
+
+    return partial
+
+
+def merge(total, partial):
+    for key, (n, s, sq) in partial.items():
+        acc = total.get(key)
+        if acc is None:
+            total[key] = [n, s, sq]
+        else:
+            acc[0] += n
+            acc[1] += s
+            acc[2] += sq
+
+
+def run_analysis(db_path, workers=None, chunk_size=CHUNK_SIZE, weights=MATH_WEIGHTS):
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+
+    total = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+
+        for rows in iter_session_chunks(db_path, chunk_size):
+            pending.add(pool.submit(analyse_chunk, db_path, rows, weights))
+
+            # Backpressure: stop reading chunks while the pool is saturated.
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merge(total, future.result())
+
+        for future in pending:
+            merge(total, future.result())
+
+    return total
+
+
+def summarise(total):
+
+    for (field, group, metric), (n, s, sq) in sorted(total.items(), key=lambda item: tuple(str(k) for k in item[0])):
+        mean = s / n
+        variance = max(0.0, sq / n - mean * mean)
+        std = math.sqrt(variance * n / (n - 1)) if n > 1 else None
+        yield field, group, metric, n, mean, std
+
+
+# ================= COMMAND LINE =================
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Score every stored session and break the results down by demographics."
+    )
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--out", default="cohort_summary.csv")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--math-weights", default="1,2,3")
+
+    args = parser.parse_args()
+
+    weights = dict(zip(MATH_WEIGHTS, (float(w) for w in args.math_weights.split(","))))
+    total = run_analysis(args.db, args.workers, args.chunk_size, weights)
+
+    with open(args.out, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["field", "group", "metric", "n", "mean", "std"])
+        writer.writerows(summarise(total))
+
+    sessions = max((acc[0] for key, acc in total.items() if key[0] == "all"), default=0)
+    print(f"Analysed {sessions} sessions -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import numpy as np
+
+QUESTION_POOL_SIZE = 100
+
+DIFFICULTIES = ("easy", "moderate", "hard")
+DIFFICULTY_WEIGHTS = (0.4, 0.35, 0.25)
+
+
+# ================= PATTERN TABLE =================
+
+# One row per pattern: (name, difficulty, template, operand ranges).
+# Operand ranges are inclusive (low, high) pairs for the slots a, b, c, d.
+# For the division patterns slot "a" holds the quotient; the dividend is
+# rebuilt as quotient * b so every answer stays an integer.
+
+PATTERNS = (
+    ("add", 0, "{a} + {b}", ((1, 50), (1, 50), (0, 0), (0, 0))),
+    ("sub", 0, "{a} - {b}", ((20, 70), (1, 20), (0, 0), (0, 0))),
+    ("mul", 0, "{a} * {b}", ((2, 12), (2, 12), (0, 0), (0, 0))),
+    ("div", 0, "{a} / {b}", ((2, 12), (2, 12), (0, 0), (0, 0))),
+    ("add_mul", 1, "{a} + {b} * {c}", ((1, 20), (1, 10), (1, 10), (0, 0))),
+    ("sub_mul", 1, "{a} - {b} * {c}", ((20, 50), (1, 10), (1, 10), (0, 0))),
+    ("div_add", 1, "{a} / {b} + {c}", ((2, 10), (2, 10), (1, 20), (0, 0))),
+    ("add_div", 1, "{c} + {a} / {b}", ((2, 10), (2, 10), (1, 20), (0, 0))),
+    ("bracket_mul", 2, "({a} - {b}) * {c}", ((1, 20), (1, 20), (1, 10), (0, 0))),
+    ("bracket_div", 2, "({a} / {b}) + {c}", ((2, 10), (2, 10), (1, 10), (0, 0))),
+    ("complex_mix", 2, "({a} + {b}) - {c} * {d}", ((1, 20), (1, 10), (2, 10), (1, 10))),
+)
+
+PATTERN_NAMES = tuple(p[0] for p in PATTERNS)
+TEMPLATES = tuple(p[2] for p in PATTERNS)
+
+_PATTERN_DIFFICULTY = np.array([p[1] for p in PATTERNS], dtype=np.int8)
+_LOW = np.array([[r[0] for r in p[3]] for p in PATTERNS], dtype=np.int64)
+_HIGH = np.array([[r[1] for r in p[3]] for p in PATTERNS], dtype=np.int64)
+
+# Patterns are grouped by difficulty, so each difficulty owns a contiguous
+# run of pattern codes starting at _FIRST_PATTERN.
+_PATTERN_COUNT = np.bincount(_PATTERN_DIFFICULTY, minlength=len(DIFFICULTIES))
+_FIRST_PATTERN = np.concatenate(([0], np.cumsum(_PATTERN_COUNT)[:-1]))
+
+_DIVISION = np.isin(PATTERN_NAMES, ["div", "div_add", "add_div", "bracket_div"])
+
+
+# ================= BATCH GENERATOR =================
+
+def _answers(pattern, a, b, c, d):
+
+    # Same arithmetic the expressions spell out, one vectorised branch per
+    # pattern; for division patterns `a` is still the quotient here.
+
+    return np.select(
+        [pattern == i for i in range(len(PATTERNS))],
+        [
+            a + b,
+            a - b,
+            a * b,
+            a,
+            a + b * c,
+            a - b * c,
+            a + c,
+            c + a,
+            (a - b) * c,
+            a + c,
+            (a + b) - c * d,
+        ]
+    )
+
+
+def sample_math_pools(num_pools, pool_size=QUESTION_POOL_SIZE, seed=None):
+
+    rng = np.random.default_rng(seed)
+    shape = (num_pools, pool_size)
+
+    difficulty = rng.choice(
+        len(DIFFICULTIES), size=shape, p=DIFFICULTY_WEIGHTS
+    ).astype(np.int8)
+
+    pattern = (
+        _FIRST_PATTERN[difficulty]
+        + (rng.random(shape) * _PATTERN_COUNT[difficulty]).astype(np.int64)
+    )
+
+    operands = rng.integers(_LOW[pattern], _HIGH[pattern], endpoint=True)
+    a, b, c, d = np.moveaxis(operands, -1, 0)
+
+    answer = _answers(pattern, a, b, c, d)
+
+    division = _DIVISION[pattern]
+    operands[..., 0] = np.where(division, a * b, a)
+
+    return {
+        "difficulty": difficulty,
+        "pattern": pattern.astype(np.int8),
+        "operands": operands.astype(np.int16),
+        "answer": answer.astype(np.int32),
+    }
+
+
+# ================= FORMATTING =================
+
+def pool_questions(pools, index=0):
+
+    difficulty = pools["difficulty"][index]
+    pattern = pools["pattern"][index]
+    operands = pools["operands"][index]
+    answer = pools["answer"][index]
+
+    questions = []
+
+    for p, ops, ans, diff in zip(pattern.tolist(), operands.tolist(), answer.tolist(), difficulty.tolist()):
+        a, b, c, d = ops
+        expr = TEMPLATES[p].format(a=a, b=b, c=c, d=d)
+        questions.append((expr, ans, DIFFICULTIES[diff]))
+
+    return questions
+
+
+# ================= ADAPTIVE SELECTION =================
+
+# Two-down/one-up staircase over the difficulty codes: two correct answers
+# in a row move up a level, a wrong answer or a skip moves down one.
+STAIRCASE_UP = 2
+
+
+def next_level(level, streak, correct):
+
+    # (level, streak) after one response; constant time.
+
+    if not correct:
+        return max(level - 1, 0), 0
+
+    streak += 1
+    if streak >= STAIRCASE_UP:
+        return min(level + 1, len(DIFFICULTIES) - 1), 0
+
+    return level, streak
+
+
+def generate_question(difficulty, rng):
+
+    # One question of the given difficulty code, drawn the same way as a
+    # pool entry but on demand.
+
+    pattern = int(_FIRST_PATTERN[difficulty] + rng.integers(_PATTERN_COUNT[difficulty]))
+    a, b, c, d = rng.integers(_LOW[pattern], _HIGH[pattern], endpoint=True).tolist()
+
+    answer = int(_answers(np.int64(pattern), a, b, c, d))
+
+    if _DIVISION[pattern]:
+        a = a * b
+
+    expr = TEMPLATES[pattern].format(a=a, b=b, c=c, d=d)
+    return expr, answer, DIFFICULTIES[difficulty]
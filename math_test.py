@@ -1,265 +1,179 @@
 import streamlit as st
-import random
-import time
+import os
 
-TEST_DURATION = 300
-QUESTION_POOL_SIZE = 100
-
-
-# ================= ENGINE INITIALIZER =================
-
-def safe_elapsed(start_time):
-    if start_time is None:
-        return 0
-    return max(0, time.time() - start_time)
-
-
-# ================= QUESTION GENERATOR =================
-
-def generate_math_questions(num=QUESTION_POOL_SIZE):
-    questions = []
-
-    for _ in range(num):
-
-        difficulty = random.choices(
-            ["easy", "moderate", "hard"],
-            weights=[0.4, 0.35, 0.25]
-        )[0]
-
-        if difficulty == "easy":
-            pattern = random.choice(["add", "sub", "mul", "div"])
-
-            if pattern == "add":
-                a, b = random.randint(1, 50), random.randint(1, 50)
-                expr = f"{a} + {b}"
-            elif pattern == "sub":
-                a, b = random.randint(20, 70), random.randint(1, 20)
-                expr = f"{a} - {b}"
-            elif pattern == "mul":
-                a, b = random.randint(2, 12), random.randint(2, 12)
-                expr = f"{a} * {b}"
-            else:
-                b = random.randint(2, 12)
-                answer = random.randint(2, 12)
-                a = b * answer
-                expr = f"{a} / {b}"
-
-        elif difficulty == "moderate":
-            pattern = random.choice(["add_mul", "sub_mul", "div_add", "add_div"])
-
-            if pattern == "add_mul":
-                a, b, c = random.randint(1, 20), random.randint(1, 10), random.randint(1, 10)
-                expr = f"{a} + {b} * {c}"
-            elif pattern == "sub_mul":
-                a, b, c = random.randint(20, 50), random.randint(1, 10), random.randint(1, 10)
-                expr = f"{a} - {b} * {c}"
-            elif pattern == "div_add":
-                b = random.randint(2, 10)
-                answer = random.randint(2, 10)
-                a = b * answer
-                c = random.randint(1, 20)
-                expr = f"{a} / {b} + {c}"
-            else:
-                b = random.randint(2, 10)
-                answer = random.randint(2, 10)
-                a = b * answer
-                c = random.randint(1, 20)
-                expr = f"{c} + {a} / {b}"
-
-        else:
-            pattern = random.choice(["bracket_mul", "bracket_div", "complex_mix"])
-
-            if pattern == "bracket_mul":
-                a, b, c = random.randint(1, 20), random.randint(1, 20), random.randint(1, 10)
-                expr = f"({a} - {b}) * {c}"
-            elif pattern == "bracket_div":
-                b = random.randint(2, 10)
-                answer = random.randint(2, 10)
-                a = b * answer
-                c = random.randint(1, 10)
-                expr = f"({a} / {b}) + {c}"
-            else:
-                a, b, c, d = random.randint(1, 20), random.randint(1, 10), random.randint(2, 10), random.randint(1, 10)
-                expr = f"({a} + {b}) - {c} * {d}"
-
-        answer = int(eval(expr))
-        questions.append((expr, answer, difficulty))
-
-    return questions
-
-
-# ================= MAIN TEST ENGINE =================
+import numpy as np
 
-def run_math_test():
+from math_questions import DIFFICULTIES, generate_question, next_level
+from question_bank import load_question_bank
+from scoring import score_math_adaptive, score_math_counts, session_scores
+from stage_state import MathState
+from trial_engine import TrialTask, run_task
 
-    st.title("Numerical Ability Cognitive Test")
+TEST_DURATION = 300
 
-    # ---------- SESSION INITIALIZATION ----------
+# RP_MATH_ADAPTIVE=1 replaces the session's fixed question list with a
+# staircase: each item is generated after the previous response, one level
+# harder after two correct answers in a row, one easier after a miss.
+ADAPTIVE = os.environ.get("RP_MATH_ADAPTIVE", "0") == "1"
+ADAPTIVE_START_LEVEL = DIFFICULTIES.index("moderate")
 
-    if "test_started" not in st.session_state:
-        st.session_state.test_started = False
+# difficulty_stats keys per question difficulty.
+STAT_LEVELS = {"easy": "low", "moderate": "moderate", "hard": "high"}
 
-    if "start_time" not in st.session_state:
-        st.session_state.start_time = None
 
-    if "questions" not in st.session_state:
-        st.session_state.questions = generate_math_questions()
+# ================= QUESTIONS =================
 
-    if "current_question_index" not in st.session_state:
-        st.session_state.current_question_index = 0
+def current_question(state):
 
-    if "correct_count" not in st.session_state:
-        st.session_state.correct_count = 0
+    if state.questions is None:
+        return state.current
 
-    if "attempted" not in st.session_state:
-        st.session_state.attempted = 0
+    return state.questions[min(state.trial, len(state.questions) - 1)]
 
-    if "difficulty_stats" not in st.session_state:
-        st.session_state.difficulty_stats = {
-            "low_attempted": 0,
-            "moderate_attempted": 0,
-            "high_attempted": 0,
-            "low_correct": 0,
-            "moderate_correct": 0,
-            "high_correct": 0,
-        }
 
-    # ---------- START SCREEN ----------
+# ================= TASK =================
 
-    if not st.session_state.test_started:
+class MathTask(TrialTask):
 
-        st.write("You will have **5 minutes** to solve as many questions as possible.You can skip any question by leaving the answer blank and pressing Enter.")
+    stage = "math"
+    title = "Numerical Ability Cognitive Test"
+    start_label = "Start Test"
+    continue_label = "Continue to Stroop Test"
+    next_stage = "stroop"
 
-        if st.button("Start Test"):
+    @property
+    def block_limit(self):
+        return TEST_DURATION
 
-            st.session_state.test_started = True
-            st.session_state.start_time = time.time()
+    @property
+    def test(self):
+        # Adaptive sessions are stored, and rescored, on their own.
+        return "math_adaptive" if ADAPTIVE else "math"
 
-            st.session_state.current_question_index = 0
-            st.session_state.correct_count = 0
-            st.session_state.attempted = 0
+    # ---------- STATE AND STIMULI ----------
 
-            st.rerun()
+    def new_state(self, bank_index):
 
-        return
+        if not ADAPTIVE:
+            return MathState(load_question_bank().math_questions(bank_index))
 
-    # ---------- TIMER ----------
+        rng = np.random.default_rng(bank_index)
+        state = MathState(None, rng=rng, level=ADAPTIVE_START_LEVEL)
+        state.current = generate_question(state.level, rng)
+        return state
 
-    elapsed = safe_elapsed(st.session_state.start_time)
-    remaining = int(TEST_DURATION - elapsed)
+    def stimulus(self, state):
+        return current_question(state)
 
-    mins = max(0, remaining) // 60
-    secs = max(0, remaining) % 60
+    # ---------- SCORING ----------
 
-    st.metric("⏳ Time Remaining", f"{mins:02d}:{secs:02d}")
+    def parse_response(self, raw):
 
-    # ---------- TIME UP ----------
+        # Blank skips the question; anything else has to be an integer.
 
-    if remaining <= 0:
+        cleaned = raw.strip()
+        if cleaned:
+            int(cleaned)
+        return cleaned
 
-        st.success("Time's up!")
+    def score(self, trial, response):
+
+        # A blank answer skips the question without attempting it.
 
-        st.write("Questions Attempted:", st.session_state.attempted)
-        st.write("Correct Answers:", st.session_state.correct_count)
+        if response == "":
+            return None
 
-        if st.session_state.attempted > 0:
+        return int(response) == trial[1]
 
-            stats = st.session_state.difficulty_stats
-            weights = {"low": 1, "moderate": 2, "high": 3}
+    def collect(self, state, trial, response, correct, rt, timing):
 
-            weighted_correct = (
-                stats["low_correct"] * weights["low"] +
-                stats["moderate_correct"] * weights["moderate"] +
-                stats["high_correct"] * weights["high"]
-            )
+        if state.questions is None:
+            state.history.append((DIFFICULTIES.index(trial[2]), correct is not None, bool(correct)))
 
-            weighted_attempted = (
-                stats["low_attempted"] * weights["low"] +
-                stats["moderate_attempted"] * weights["moderate"] +
-                stats["high_attempted"] * weights["high"]
-            )
+        if correct is None:
+            return
 
-            weighted_accuracy = weighted_correct / weighted_attempted if weighted_attempted > 0 else 0
+        level = STAT_LEVELS[trial[2]]
 
-            speed_efficiency = min(st.session_state.attempted / QUESTION_POOL_SIZE, 1)
+        state.attempted += 1
+        state.difficulty_stats[f"{level}_attempted"] += 1
 
-            numerical_score = (0.7 * weighted_accuracy) + (0.3 * speed_efficiency)
+        if correct:
+            state.correct_count += 1
+            state.difficulty_stats[f"{level}_correct"] += 1
 
-            st.write("Weighted Accuracy:", f"{weighted_accuracy:.2f}")
-            st.write("Speed Efficiency:", f"{speed_efficiency:.2f}")
-            st.write("Numerical Ability Score:", f"{numerical_score:.2f}")
+    def trial_record(self, trial, response):
+        return {"stimulus": trial[0], "condition": trial[2], "response": response or None}
 
-            st.session_state["numerical_score"] = numerical_score
+    def advance(self, state, correct):
+        if state.questions is None:
+            state.level, state.streak = next_level(state.level, state.streak, correct)
+            state.current = generate_question(state.level, state.rng)
 
-        if st.button("Continue to Stroop Test"):
+    def summary(self, state):
 
-            keys_to_clear = [
-                "test_started", "start_time", "questions",
-                "current_question_index", "correct_count",
-                "attempted", "difficulty_stats"
-            ]
+        stats = state.difficulty_stats
 
-            for key in keys_to_clear:
-                st.session_state.pop(key, None)
+        if state.questions is None:
+            levels, attempted, correct = zip(*state.history) if state.history else ((), (), ())
+            scores = session_scores(score_math_adaptive(
+                np.zeros(len(levels), dtype=np.int64), levels, attempted, correct, n_sessions=1
+            ))
+            return {**scores, **stats, "adaptive": True}
+        levels = ("low", "moderate", "high")
 
-            st.session_state.current_stage = "stroop"
-            st.rerun()
+        scores = session_scores(score_math_counts(
+            [stats[f"{level}_attempted"] for level in levels],
+            [stats[f"{level}_correct"] for level in levels]
+        ))
 
-        return
+        return {**scores, **stats, "adaptive": False}
 
-    # ---------- QUESTION DISPLAY ----------
+    def carry_score(self, summary):
+        return summary["staircase_score" if summary["adaptive"] else "numerical_score"]
 
-    idx = min(
-        st.session_state.current_question_index,
-        len(st.session_state.questions) - 1
-    )
+    # ---------- RENDERING ----------
 
-    question, correct_answer, difficulty = st.session_state.questions[idx]
+    def render_intro(self, state):
+        st.write("You will have **5 minutes** to solve as many questions as possible.You can skip any question by leaving the answer blank and pressing Enter.")
 
-    st.subheader(f"Question: {question} = ?")
+    def render_trial(self, state, trial):
 
-    with st.form("math_form", clear_on_submit=True):
-        ans = st.text_input("Your answer")
-        submit = st.form_submit_button("Submit")
+        question = trial[0]
 
-    if submit:
+        st.subheader(f"Question: {question} = ?")
 
-        cleaned = ans.strip()
+        with st.form("math_form", clear_on_submit=True):
+            ans = st.text_input("Your answer")
+            submit = st.form_submit_button("Submit")
 
-        # ---- BLANK → SKIP ----
-        if cleaned == "":
-            st.session_state.current_question_index += 1
-            st.rerun()
+        if not submit:
+            return None
 
-        # ---- VALID INTEGER ----
         try:
-            numeric_answer = int(cleaned)
+            return self.parse_response(ans), None
+        except ValueError:
+            st.warning("⚠ Please enter a valid integer value or leave blank to skip.")
+            return None
 
-            st.session_state.attempted += 1
+    def render_summary(self, state, summary):
 
-            if numeric_answer == correct_answer:
-                st.session_state.correct_count += 1
+        st.success("Time's up!")
 
-            if difficulty == "easy":
-                level = "low"
-            elif difficulty == "moderate":
-                level = "moderate"
-            else:
-                level = "high"
+        st.write("Questions Attempted:", state.attempted)
+        st.write("Correct Answers:", state.correct_count)
 
-            st.session_state.difficulty_stats[f"{level}_attempted"] += 1
+        if state.attempted > 0 and summary["adaptive"]:
 
-            if numeric_answer == correct_answer:
-                st.session_state.difficulty_stats[f"{level}_correct"] += 1
+            st.write("Staircase Level (0 easy – 2 hard):", f"{summary['staircase_level']:.2f}")
+            st.write("Numerical Ability Score:", f"{summary['staircase_score']:.2f}")
 
-            st.session_state.current_question_index += 1
-            st.rerun()
+        elif state.attempted > 0:
+
+            st.write("Weighted Accuracy:", f"{summary['weighted_accuracy']:.2f}")
+            st.write("Speed Efficiency:", f"{summary['speed_efficiency']:.2f}")
+            st.write("Numerical Ability Score:", f"{summary['numerical_score']:.2f}")
 
-        # ---- INVALID INPUT ----
-        except ValueError:
-            st.warning("⚠ Please enter a valid integer value or leave blank to skip.")
-    # ---------- CLOUD SAFE REFRESH ----------
 
-    if st.session_state.test_started and remaining > 0:
-        time.sleep(0.05)
-        st.rerun()
+def run_math_test():
+    run_task(MathTask())
@@ -1,174 +1,185 @@
 import streamlit as st
 import random
-import time
+import numpy as np
+
+from profiler import count
+from scoring import score_mrt, session_scores
+from stage_state import MentalState
+from stimulus_cache import IMAGE_SETS, load_stimuli, load_stimulus_uris, variant_for_device
+from timing import mrt_runner
+from trial_engine import TrialTask, choice_buttons, run_task
 
 # ---------------------------
 # CONFIGURATION
 # ---------------------------
 
-image_sets = [
-    ("images/target1.png", "images/correct1.png", "images/wrong1.png"),
-    ("images/target2.png", "images/correct2.png", "images/wrong2.png"),
-    ("images/target3.png", "images/correct3.png", "images/wrong3.png"),
-    ("images/target4.png", "images/correct4.png", "images/wrong4.png"),
-    ("images/target5.png", "images/correct5.png", "images/wrong5.png"),
-    ("images/target6.png", "images/correct6.png", "images/wrong6.png"),
-    ("images/target7.png", "images/correct7.png", "images/wrong7.png"),
-    ("images/target8.png", "images/correct8.png", "images/wrong8.png"),
-    ("images/target9.png", "images/correct9.png", "images/wrong9.png"),
-    ("images/target10.png", "images/correct10.png", "images/wrong10.png"),
-    ("images/target11.png", "images/correct11.png", "images/wrong11.png"),
-    ("images/target12.png", "images/correct12.png", "images/wrong12.png"),
-    ("images/target13.png", "images/correct13.png", "images/wrong13.png"),
-    ("images/target14.png", "images/correct14.png", "images/wrong14.png"),
-    ("images/target15.png", "images/correct15.png", "images/wrong15.png"),
-]
-
 TOTAL_QUESTIONS = 15
 QUESTION_TIME_LIMIT = 10
 
+# Server reruns per second while a trial is open. None leaves the countdown
+# to the browser and reruns only once, when the time limit expires.
+REFRESH_TICK_RATE = None
+
+OPTION_LABELS = ("Option A", "Option B")
+
 
 # ---------------------------
-# MAIN ENGINE
+# STIMULI
 # ---------------------------
 
-def run_mental_rotation_test():
+def stimulus_variant():
+    # Image resolution for the device the participant reported.
+    return variant_for_device(st.session_state.get("demographics", {}).get("device"))
 
-    st.title("🧠 Mental Rotation Task")
 
-    # ---------- SESSION INIT ----------
+def shuffled_options(correct_img, wrong_img):
+    options = [
+        {"img": correct_img, "correct": True},
+        {"img": wrong_img, "correct": False},
+    ]
+    random.shuffle(options)
+    return options
 
-    if "mrt_initialized" not in st.session_state:
-        st.session_state.mrt_initialized = True
-        st.session_state.mrt_question = 0
-        st.session_state.mrt_results = []
-        st.session_state.mrt_randomized = random.sample(
-            range(len(image_sets)), TOTAL_QUESTIONS
-        )
-        st.session_state.mrt_question_start = None
-        st.session_state.mrt_options = None
 
-    # ---------- COMPLETION ----------
+# ---------------------------
+# TASK
+# ---------------------------
 
-    if st.session_state.mrt_question >= TOTAL_QUESTIONS:
+class MentalRotationTask(TrialTask):
 
-        correct = sum(r["correct"] for r in st.session_state.mrt_results)
-        accuracy = (correct / TOTAL_QUESTIONS) * 100
-        avg_time = sum(r["time"] for r in st.session_state.mrt_results) / TOTAL_QUESTIONS
-        timed_out = sum(r["timed_out"] for r in st.session_state.mrt_results)
+    stage = "mental"
+    title = "🧠 Mental Rotation Task"
+    continue_options = {"type": "primary", "use_container_width": True}
+    next_stage = "final"
+    total_trials = TOTAL_QUESTIONS
+    tick_rate = REFRESH_TICK_RATE
 
-        st.markdown("## 🧠 Task Completed")
-        st.markdown("---")
+    @property
+    def time_limit(self):
+        return QUESTION_TIME_LIMIT
 
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Accuracy", f"{accuracy:.1f}%")
-        col2.metric("Avg Reaction Time", f"{avg_time:.2f}s")
-        col3.metric("Timed Out", f"{timed_out}/{TOTAL_QUESTIONS}")
+    @property
+    def timeout_rt(self):
+        return QUESTION_TIME_LIMIT
 
-        # Store score if needed for final stage
-        st.session_state.mrt_score = accuracy
+    # ---------- STATE AND STIMULI ----------
 
-        if st.button("Continue", type="primary", use_container_width=True):
+    def new_state(self, bank_index):
+        randomized = random.sample(range(len(IMAGE_SETS)), TOTAL_QUESTIONS)
+        options = [shuffled_options(*IMAGE_SETS[i][1:]) for i in randomized]
+        return MentalState(randomized, options)
 
-            # Clean MRT session keys
-            for key in list(st.session_state.keys()):
-                if key.startswith("mrt_"):
-                    del st.session_state[key]
+    def stimulus(self, state):
+        # (target image, [option A, option B])
+        return IMAGE_SETS[state.randomized[state.trial]][0], state.options[state.trial]
 
-            st.session_state.current_stage = "final"
-            st.rerun()
+    # ---------- SCORING ----------
 
-        return
+    def parse_response(self, raw):
+        if raw not in ("A", "B"):
+            raise ValueError(f"Not an option: {raw!r}")
+        return raw
 
-    # ---------- QUESTION PHASE ----------
+    def score(self, trial, response):
+        return trial[1]["AB".index(response)]["correct"]
 
-    if st.session_state.mrt_question_start is None:
-        st.session_state.mrt_question_start = time.time()
+    def collect(self, state, trial, response, correct, rt, timing):
+        state.results.append({
+            "correct": correct,
+            "time": rt,
+            "timed_out": response is None
+        })
 
-    elapsed = time.time() - st.session_state.mrt_question_start
-    remaining = max(0.0, QUESTION_TIME_LIMIT - elapsed)
+    def trial_record(self, trial, response):
+        return {"stimulus": trial[0], "response": response}
 
-    # Auto timeout
-    if elapsed >= QUESTION_TIME_LIMIT:
-        st.session_state.mrt_results.append({
-            "correct": False,
-            "time": QUESTION_TIME_LIMIT,
-            "timed_out": True
-        })
-        st.session_state.mrt_question += 1
-        st.session_state.mrt_question_start = None
-        st.session_state.mrt_options = None
-        st.rerun()
+    def summary(self, state):
 
-    # ---------- UI ----------
+        results = state.results
 
-    st.markdown(
-        f"**Question {st.session_state.mrt_question + 1} of {TOTAL_QUESTIONS}**"
-    )
+        return session_scores(score_mrt(
+            np.zeros(len(results), dtype=np.int64),
+            [r["correct"] for r in results],
+            [r["time"] for r in results],
+            [r["timed_out"] for r in results],
+            n_sessions=1
+        ))
 
-    progress_fraction = remaining / QUESTION_TIME_LIMIT
-    timer_color = "🟢" if remaining > 3 else ("🟡" if remaining > 1.5 else "🔴")
-    st.progress(progress_fraction, text=f"{timer_color} Time left: {remaining:.1f}s")
+    def carry_score(self, summary):
+        return summary["accuracy"]
 
-    trial_idx = st.session_state.mrt_randomized[
-        st.session_state.mrt_question
-    ]
+    # ---------- RENDERING ----------
 
-    target_img, correct_img, wrong_img = image_sets[trial_idx]
+    def progress_label(self, state):
+        return f"**Question {state.trial + 1} of {TOTAL_QUESTIONS}**"
 
-    if st.session_state.mrt_options is None:
-        options = [
-            {"img": correct_img, "correct": True},
-            {"img": wrong_img, "correct": False},
-        ]
-        random.shuffle(options)
-        st.session_state.mrt_options = options
-    else:
-        options = st.session_state.mrt_options
+    def render_trial(self, state, trial):
 
-    st.markdown("---")
-    col_center = st.columns([1, 1, 1])
-    with col_center[1]:
-        st.image(target_img, width=175)
+        target_img, options = trial
+        stimuli = load_stimuli(IMAGE_SETS, stimulus_variant())
 
-    st.markdown("---")
-    st.markdown("### 👆 Click on the correct rotated version:")
+        st.markdown("---")
+        col_center = st.columns([1, 1, 1])
+        with col_center[1]:
+            st.image(stimuli[target_img], width=175)
+            count("image")
 
-    col1, col2 = st.columns(2)
+        st.markdown("---")
+        st.markdown("### 👆 Click on the correct rotated version:")
+
+        for option, col in zip(options, st.columns(2)):
+            with col:
+                st.image(stimuli[option["img"]], width=175)
+                count("image")
+
+        answer = choice_buttons(self, state, OPTION_LABELS)
 
-    with col1:
-        st.image(options[0]["img"], width=175)
-        if st.button("Option A", key=f"mrt_a_{st.session_state.mrt_question}"):
+        if answer is None:
+            return None
 
-            rt = time.time() - st.session_state.mrt_question_start
+        label, client = answer
+        return "AB"[OPTION_LABELS.index(label)], client
 
-            st.session_state.mrt_results.append({
-                "correct": options[0]["correct"],
-                "time": rt,
-                "timed_out": False
-            })
+    def render_summary(self, state, summary):
 
-            st.session_state.mrt_question += 1
-            st.session_state.mrt_question_start = None
-            st.session_state.mrt_options = None
-            st.rerun()
+        accuracy = summary["accuracy"]
+        avg_time = summary["avg_time"]
+        timed_out = summary["timed_out"]
 
-    with col2:
-        st.image(options[1]["img"], width=175)
-        if st.button("Option B", key=f"mrt_b_{st.session_state.mrt_question}"):
+        st.markdown("## 🧠 Task Completed")
+        st.markdown("---")
 
-            rt = time.time() - st.session_state.mrt_question_start
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Accuracy", f"{accuracy:.1f}%")
+        col2.metric("Avg Reaction Time", f"{avg_time:.2f}s")
+        col3.metric("Timed Out", f"{timed_out}/{TOTAL_QUESTIONS}")
 
-            st.session_state.mrt_results.append({
-                "correct": options[1]["correct"],
-                "time": rt,
-                "timed_out": False
-            })
+    def run_block(self, state):
 
-            st.session_state.mrt_question += 1
-            st.session_state.mrt_question_start = None
-            st.session_state.mrt_options = None
-            st.rerun()
+        # The whole block in the browser (mrt_runner), with every image it
+        # needs sent up front as a data URI.
 
-    # Smooth refresh without blocking
-    st.rerun()
+        trials = [
+            (IMAGE_SETS[i][0], [option["img"] for option in options])
+            for i, options in zip(state.randomized, state.options)
+        ]
+
+        uris = load_stimulus_uris(IMAGE_SETS, stimulus_variant())
+        images = {path: uris[path] for target, options in trials for path in (target, *options)}
+
+        results = mrt_runner(
+            trials, images, QUESTION_TIME_LIMIT,
+            run=st.session_state.session_id, key="mrt_runner"
+        )
+
+        if results is None or len(results) != TOTAL_QUESTIONS:
+            return None
+
+        return [
+            (r.get("choice") if r.get("choice") in ("A", "B") else None, r.get("client_rt"))
+            for r in results
+        ]
+
+
+def run_mental_rotation_test():
+    run_task(MentalRotationTask())
@@ -0,0 +1,154 @@
+import collections
+import statistics
+import threading
+import time
+
+import streamlit as st
+
+# Live view of the sessions this process serves. Script runs and the trial
+# engine publish events (a session seen at a stage, a stage change, a trial
+# completed or timed out); the Monitor folds each one into running
+# aggregates as it arrives, so the admin view never rescans stored results.
+# Memory is bounded: one entry per participant active within
+# ACTIVE_WINDOW, and fixed-size rings for recent trials and events.
+
+STAGES = ("consent", "instructions", "math", "stroop", "mental", "final")
+
+# A participant with no script run for this long is no longer counted.
+ACTIVE_WINDOW = 600
+
+# Most recent trials per test kept for the median RT and timeout rate.
+TRIAL_WINDOW = 500
+
+# Most recent events kept for the feed in the admin view.
+EVENT_LOG_SIZE = 100
+
+# Idle participants are dropped at most this often outside of snapshots.
+PRUNE_INTERVAL = 60
+
+
+# ================= STORE =================
+
+class Monitor:
+
+    def __init__(self, active_window=ACTIVE_WINDOW, trial_window=TRIAL_WINDOW):
+        self._lock = threading.Lock()
+        self.active_window = active_window
+        self.sessions = {}      # session_id -> [stage, trials in stage, last seen]
+        self.recent = collections.defaultdict(lambda: collections.deque(maxlen=trial_window))
+        self.totals = collections.defaultdict(collections.Counter)
+        self.events = collections.deque(maxlen=EVENT_LOG_SIZE)
+        self.sequence = 0
+        self.started_at = time.time()
+        self._last_prune = self.started_at
+
+    # ---------- EVENTS ----------
+
+    def observe(self, session_id, stage):
+
+        # Once per script run: refreshes the participant's last-seen time
+        # and publishes a stage event when the stage has changed.
+
+        now = time.time()
+
+        with self._lock:
+            entry = self.sessions.get(session_id)
+
+            if entry is not None and entry[0] == stage:
+                entry[2] = now
+            else:
+                self._publish(now, "stage", session_id, stage, previous=entry[0] if entry else None)
+
+            self._maybe_prune(now)
+
+    def trial(self, session_id, stage, trial, rt=None, timed_out=False):
+
+        now = time.time()
+
+        with self._lock:
+            self._publish(
+                now, "timeout" if timed_out else "trial", session_id, stage,
+                trial=trial, rt=rt
+            )
+
+    def _publish(self, now, kind, session_id, stage, **fields):
+
+        self.sequence += 1
+        self.events.append((self.sequence, now, kind, session_id, stage, fields))
+
+        if kind == "stage":
+            self.sessions[session_id] = [stage, 0, now]
+            self.totals[stage]["entered"] += 1
+            return
+
+        entry = self.sessions.setdefault(session_id, [stage, 0, now])
+        entry[1] = fields.get("trial") or entry[1] + 1
+        entry[2] = now
+
+        timed_out = kind == "timeout"
+        self.recent[stage].append((fields.get("rt"), timed_out))
+        self.totals[stage]["trials"] += 1
+        self.totals[stage]["timeouts"] += timed_out
+
+    def _maybe_prune(self, now):
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self._prune(now)
+
+    def _prune(self, now):
+        cutoff = now - self.active_window
+        for session_id in [s for s, entry in self.sessions.items() if entry[2] < cutoff]:
+            del self.sessions[session_id]
+        self._last_prune = now
+
+    # ---------- DUMPS ----------
+
+    def snapshot(self):
+
+        now = time.time()
+
+        with self._lock:
+            self._prune(now)
+            sessions = [(s, *entry) for s, entry in self.sessions.items()]
+            recent = {stage: list(ring) for stage, ring in self.recent.items()}
+            totals = {stage: dict(counter) for stage, counter in self.totals.items()}
+            events = list(self.events)
+
+        active = collections.Counter(stage for _, stage, _, _ in sessions)
+        progress = collections.defaultdict(list)
+        for _, stage, trials, _ in sessions:
+            progress[stage].append(trials)
+
+        stages = {}
+        for stage in STAGES:
+            window = recent.get(stage, ())
+            rts = [rt for rt, timed_out in window if not timed_out and rt is not None]
+            total = totals.get(stage, {})
+            stages[stage] = {
+                "active": active.get(stage, 0),
+                "mean_trials_done": statistics.fmean(progress[stage]) if progress[stage] else None,
+                "recent_trials": len(window),
+                "median_rt": statistics.median(rts) if rts else None,
+                "timeout_rate": sum(t for _, t in window) / len(window) if window else None,
+                "entered": total.get("entered", 0),
+                "trials": total.get("trials", 0),
+                "timeouts": total.get("timeouts", 0),
+            }
+
+        return {
+            "since": self.started_at,
+            "active": len(sessions),
+            "stages": stages,
+            "sessions": [
+                {"session_id": s, "stage": stage, "trials_done": trials, "idle_s": now - seen}
+                for s, stage, trials, seen in sorted(sessions, key=lambda row: row[3], reverse=True)
+            ],
+            "events": [
+                {"seq": seq, "at": at, "kind": kind, "session_id": s, "stage": stage, **fields}
+                for seq, at, kind, s, stage, fields in reversed(events)
+            ],
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def get_monitor():
+    return Monitor()
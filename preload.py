@@ -0,0 +1,29 @@
+import importlib
+import threading
+
+import streamlit as st
+
+# Test engines, in the order participants reach them. The router imports
+# each one only when its stage comes up; meanwhile a background thread
+# imports them (and with them pandas and streamlit_autorefresh) while the
+# participant is still reading the consent page.
+ENGINE_MODULES = ("math_test", "stroop_test", "mental_rotation_test")
+
+
+def _import_engines():
+    for name in ENGINE_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            # The router's own import will raise it where it can be shown.
+            return
+
+
+@st.cache_resource(show_spinner=False)
+def start_preload():
+
+    # Once per process; later calls return the same thread.
+
+    thread = threading.Thread(target=_import_engines, name="engine-preload", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,171 @@
+import collections
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+# Off unless RP_PROFILE=1; when off, profile_run and count return at once.
+ENABLED = os.environ.get("RP_PROFILE", "0") == "1"
+
+# Most recent script runs kept for percentiles, across all sessions.
+RING_SIZE = 2048
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+# Script runs execute one per thread, so the counters of the run in
+# progress live in a thread-local.
+_current = threading.local()
+
+
+# ================= STORE =================
+
+class Profiler:
+
+    def __init__(self, ring_size=RING_SIZE):
+        self._lock = threading.Lock()
+        self.ring = collections.deque(maxlen=ring_size)
+        self.totals = collections.defaultdict(lambda: collections.Counter())
+        self.started_at = time.time()
+
+    def record(self, stage, wall_s, counters):
+
+        with self._lock:
+            self.ring.append((time.time(), stage, wall_s, dict(counters)))
+
+            totals = self.totals[stage]
+            totals["runs"] += 1
+            totals["wall_seconds"] += wall_s
+            totals.update(counters)
+
+    # ---------- DUMPS ----------
+
+    def snapshot(self):
+
+        with self._lock:
+            ring = list(self.ring)
+            totals = {stage: dict(counter) for stage, counter in self.totals.items()}
+
+        walls = collections.defaultdict(list)
+        for _, stage, wall_s, _ in ring:
+            walls[stage].append(wall_s)
+
+        stages = {}
+        for stage, total in totals.items():
+            recent = sorted(walls.get(stage, ()))
+            stages[stage] = {
+                **total,
+                "recent_runs": len(recent),
+                "recent_wall_seconds": {
+                    str(q): recent[min(len(recent) - 1, int(q * len(recent)))] if recent else None
+                    for q in QUANTILES
+                },
+            }
+
+        return {"enabled": ENABLED, "since": self.started_at, "stages": stages}
+
+    def dump_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def dump_prometheus(self):
+
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        stages = snapshot["stages"]
+
+        metric("rp_script_runs_total", "counter", "Script runs per stage.", [
+            ({"stage": s}, d.get("runs", 0)) for s, d in stages.items()
+        ])
+        metric("rp_script_run_seconds_total", "counter", "Wall time spent in script runs.", [
+            ({"stage": s}, d.get("wall_seconds", 0.0)) for s, d in stages.items()
+        ])
+        metric("rp_image_calls_total", "counter", "st.image calls.", [
+            ({"stage": s}, d.get("image", 0)) for s, d in stages.items()
+        ])
+        metric("rp_state_mutations_total", "counter", "Session state keys added, removed or reassigned.", [
+            ({"stage": s}, d.get("state_mutations", 0)) for s, d in stages.items()
+        ])
+        metric("rp_stage_state_writes_total", "counter", "Attribute writes on test state objects.", [
+            ({"stage": s}, d.get("stage_state_writes", 0)) for s, d in stages.items()
+        ])
+        metric("rp_script_run_seconds", "summary", "Recent script run wall time.", [
+            ({"stage": s, "quantile": q}, v)
+            for s, d in stages.items()
+            for q, v in d["recent_wall_seconds"].items()
+            if v is not None
+        ])
+
+        return "\n".join(lines) + "\n"
+
+
+@st.cache_resource(show_spinner=False)
+def get_profiler():
+    return Profiler()
+
+
+# ================= HOT PATH =================
+
+def _state_fingerprint():
+
+    # Identity of every value, plus the value itself for scalars, so a
+    # rebinding shows up even when the new value is equal-sized.
+
+    fingerprint = {}
+    for key, value in st.session_state.items():
+        if isinstance(value, (int, float, str, bool, type(None))):
+            fingerprint[key] = (id(value), value)
+        else:
+            fingerprint[key] = id(value)
+    return fingerprint
+
+
+_MISSING = object()
+
+
+def _mutations(before, after):
+    changed = sum(1 for key, value in after.items() if before.get(key, _MISSING) != value)
+    removed = sum(1 for key in before if key not in after)
+    return changed + removed
+
+
+@contextmanager
+def profile_run(stage):
+
+    if not ENABLED:
+        yield
+        return
+
+    counters = collections.Counter()
+    _current.counters = counters
+
+    before = _state_fingerprint()
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        # Also runs when the stage ends with st.rerun() or st.stop().
+        wall_s = time.perf_counter() - start
+        counters["state_mutations"] += _mutations(before, _state_fingerprint())
+        _current.counters = None
+        get_profiler().record(stage, wall_s, counters)
+
+
+def count(name, n=1):
+
+    if not ENABLED:
+        return
+
+    counters = getattr(_current, "counters", None)
+    if counters is not None:
+        counters[name] += n
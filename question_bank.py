@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import secrets
+import time
+
+import numpy as np
+import streamlit as st
+
+from math_questions import QUESTION_POOL_SIZE, pool_questions, sample_math_pools
+from stroop_questions import TOTAL_QUESTIONS, sample_stroop_sequences, sequence_trials
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_BANK_DIR = os.path.join(BASE_DIR, "banks")
+DEFAULT_NUM_BANKS = 5000
+DEFAULT_SEED = 20240601
+
+MANIFEST = "manifest.json"
+
+MATH_FIELDS = ("difficulty", "pattern", "operands", "answer")
+STROOP_FIELDS = ("word", "color", "condition")
+
+
+# ================= BANK =================
+
+class QuestionBank:
+
+    # Bank i is one math pool plus one full Stroop sequence; both are read
+    # straight out of the (memory-mapped) arrays, so a lookup is O(1).
+
+    def __init__(self, math, stroop, manifest):
+        self.math = math
+        self.stroop = stroop
+        self.manifest = manifest
+
+    def __len__(self):
+        return self.manifest["num_banks"]
+
+    def index_for_seed(self, seed):
+        return int(seed) % len(self)
+
+    def random_index(self):
+        return secrets.randbelow(len(self))
+
+    def math_questions(self, index):
+        return pool_questions(self.math, index)
+
+    def stroop_trials(self, index):
+        return sequence_trials(self.stroop, index)
+
+
+def generate_bank(num_banks=DEFAULT_NUM_BANKS, seed=DEFAULT_SEED):
+
+    # Independent child streams, so the math pools do not change if the
+    # Stroop generator ever draws a different number of values.
+    math_seed, stroop_seed = np.random.SeedSequence(seed).spawn(2)
+
+    manifest = {
+        "num_banks": num_banks,
+        "seed": seed,
+        "math_pool_size": QUESTION_POOL_SIZE,
+        "stroop_length": TOTAL_QUESTIONS,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+    return QuestionBank(
+        sample_math_pools(num_banks, QUESTION_POOL_SIZE, math_seed),
+        sample_stroop_sequences(num_banks, TOTAL_QUESTIONS, stroop_seed),
+        manifest
+    )
+
+
+# ================= ON-DISK FORMAT =================
+
+# One .npy file per field plus a JSON manifest. Plain .npy (not .npz) so
+# every array can be memory-mapped and shared by all sessions in a process.
+
+def save_bank(bank, path=DEFAULT_BANK_DIR):
+
+    os.makedirs(path, exist_ok=True)
+
+    for field in MATH_FIELDS:
+        np.save(os.path.join(path, f"math_{field}.npy"), bank.math[field])
+
+    for field in STROOP_FIELDS:
+        np.save(os.path.join(path, f"stroop_{field}.npy"), bank.stroop[field])
+
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump(bank.manifest, f, indent=2)
+
+
+def open_bank(path=DEFAULT_BANK_DIR):
+
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+
+    math = {
+        field: np.load(os.path.join(path, f"math_{field}.npy"), mmap_mode="r")
+        for field in MATH_FIELDS
+    }
+    stroop = {
+        field: np.load(os.path.join(path, f"stroop_{field}.npy"), mmap_mode="r")
+        for field in STROOP_FIELDS
+    }
+
+    return QuestionBank(math, stroop, manifest)
+
+
+@st.cache_resource(show_spinner=False)
+def load_question_bank(path=DEFAULT_BANK_DIR):
+
+    # Fall back to generating the default bank in memory when none has been
+    # built. It is seeded, so indices stay reproducible either way.
+
+    if os.path.exists(os.path.join(path, MANIFEST)):
+        return open_bank(path)
+
+    return generate_bank()
+
+
+# ================= COMMAND LINE =================
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Build or inspect the question bank.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="precompute math pools and Stroop sequences")
+    build.add_argument("--out", default=DEFAULT_BANK_DIR)
+    build.add_argument("--banks", type=int, default=DEFAULT_NUM_BANKS)
+    build.add_argument("--seed", type=int, default=DEFAULT_SEED)
+
+    show = sub.add_parser("show", help="print the stimuli handed out for one bank index")
+    show.add_argument("index", type=int)
+    show.add_argument("--path", default=DEFAULT_BANK_DIR)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        bank = generate_bank(args.banks, args.seed)
+        save_bank(bank, args.out)
+        print(f"Wrote {len(bank)} banks to {args.out}")
+
+    else:
+        bank = open_bank(args.path)
+        print(json.dumps({
+            "index": args.index,
+            "manifest": bank.manifest,
+            "math": bank.math_questions(args.index),
+            "stroop": bank.stroop_trials(args.index),
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,706 @@
+import argparse
+import atexit
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_DB_PATH = os.environ.get(
+    "RP_RESULTS_DB", os.path.join(BASE_DIR, "results", "results.db")
+)
+
+# A flush happens when this many records are waiting, or when the oldest
+# waiting record is older than FLUSH_INTERVAL seconds.
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 2.0
+
+# Records queued for the writer thread. When the queue is full, recording
+# waits for the writer to catch up instead of growing without bound.
+QUEUE_SIZE = 10000
+
+# Longest a session-end drain waits for its records to reach the disk.
+DRAIN_TIMEOUT = 10.0
+
+# After a failed write the batch is retried after RETRY_DELAY seconds,
+# doubling on every further failure up to RETRY_MAX_DELAY. While it waits,
+# at most MAX_PENDING records are taken off the queue; beyond that the
+# queue fills and recording waits, as it does for a slow disk.
+RETRY_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+MAX_PENDING = 5000
+
+# Longest recording waits on a full queue. A record the writer thread has
+# not taken by then is written directly instead.
+PUT_TIMEOUT = 5.0
+
+logger = logging.getLogger(__name__)
+
+DEMOGRAPHIC_FIELDS = (
+    "name", "age", "gender", "hometown", "current_city", "mother_language",
+    "academic", "service", "handedness", "device", "vision", "prior_exposure",
+)
+
+TRIAL_FIELDS = (
+    "session_id", "test", "trial", "stimulus", "condition",
+    "response", "correct", "rt", "timed_out", "recorded_at",
+    "onset_ns", "response_ns", "client_rt", "latency",
+)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    started_at REAL,
+    bank_index INTEGER,
+    {", ".join(f"{field} TEXT" for field in DEMOGRAPHIC_FIELDS)}
+);
+
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    test TEXT NOT NULL,
+    trial INTEGER,
+    stimulus TEXT,
+    condition TEXT,
+    response TEXT,
+    correct INTEGER,
+    rt REAL,
+    timed_out INTEGER,
+    recorded_at REAL,
+    onset_ns INTEGER,
+    response_ns INTEGER,
+    client_rt REAL,
+    latency REAL
+);
+
+CREATE INDEX IF NOT EXISTS trials_session ON trials (session_id, test);
+
+CREATE TABLE IF NOT EXISTS summaries (
+    session_id TEXT NOT NULL,
+    test TEXT NOT NULL,
+    metrics TEXT,
+    recorded_at REAL,
+    PRIMARY KEY (session_id, test)
+);
+"""
+
+_SESSION_SQL = (
+    f"INSERT OR REPLACE INTO sessions "
+    f"(session_id, started_at, bank_index, {', '.join(DEMOGRAPHIC_FIELDS)}) "
+    f"VALUES ({', '.join('?' * (3 + len(DEMOGRAPHIC_FIELDS)))})"
+)
+
+_TRIAL_SQL = (
+    f"INSERT INTO trials ({', '.join(TRIAL_FIELDS)}) "
+    f"VALUES ({', '.join('?' * len(TRIAL_FIELDS))})"
+)
+
+# Rows per query and per written chunk in dataset exports.
+EXPORT_CHUNK_SIZE = 5000
+
+EXPORT_TABLES = ("trials", "sessions")
+EXPORT_FORMATS = ("csv", "parquet")
+
+TESTS = ("math", "math_adaptive", "stroop", "mental")
+
+# Column types for Parquet; every other column is text.
+_INTEGER_COLUMNS = {
+    "id", "trial", "correct", "timed_out", "onset_ns", "response_ns", "bank_index",
+}
+_REAL_COLUMNS = {"rt", "recorded_at", "client_rt", "latency", "started_at"}
+
+_SUMMARY_SQL = (
+    "INSERT OR REPLACE INTO summaries (session_id, test, metrics, recorded_at) "
+    "VALUES (?, ?, ?, ?)"
+)
+
+_TABLES = {_SESSION_SQL: "sessions", _TRIAL_SQL: "trials", _SUMMARY_SQL: "summaries"}
+
+
+# ================= STORE =================
+
+class ResultsStore:
+
+    # One instance per process, shared by every session. Test engines only
+    # put records on a bounded queue; a single writer thread owns the
+    # database connection and writes them in one transaction per batch, so
+    # no script run ever waits on the disk between a response and the next
+    # stimulus.
+
+    def __init__(self, path=DEFAULT_DB_PATH, queue_size=QUEUE_SIZE):
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self.path = path
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = {_SESSION_SQL: [], _TRIAL_SQL: [], _SUMMARY_SQL: []}
+        self._pending_count = 0
+        self._oldest_pending = None
+        self._error = None
+        self._failures = 0
+        self._retry_at = None
+        self._closed = threading.Event()
+
+        # Records the database refuses outright (a bad value, a constraint)
+        # are set aside here, one JSON line each, so they cannot hold up the
+        # rest of the batch.
+        self.quarantine_path = f"{path}.quarantine.jsonl"
+        self.quarantined = 0
+        self._quarantine_lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        self._writer = threading.Thread(
+            target=self._run_writer, name="results-writer", daemon=True
+        )
+        self._writer.start()
+
+        atexit.register(self.close)
+
+    # ---------- RECORDING ----------
+
+    def record_session(self, session_id, demographics, bank_index=None, started_at=None):
+
+        row = (
+            session_id,
+            started_at if started_at is not None else time.time(),
+            bank_index,
+            *(demographics.get(field) for field in DEMOGRAPHIC_FIELDS),
+        )
+        self._add(_SESSION_SQL, row)
+
+    def record_trial(self, session_id, test, trial, stimulus=None, condition=None,
+                     response=None, correct=None, rt=None, timed_out=False,
+                     onset_ns=None, response_ns=None, client_rt=None, latency=None):
+
+        row = (
+            session_id, test, trial, stimulus, condition, response,
+            None if correct is None else int(correct),
+            rt, int(timed_out), time.time(),
+            onset_ns, response_ns, client_rt, latency,
+        )
+        self._add(_TRIAL_SQL, row)
+
+    def record_summary(self, session_id, test, metrics):
+        self._add(_SUMMARY_SQL, (session_id, test, json.dumps(metrics), time.time()))
+
+    def _add(self, sql, row):
+        # Blocks only while the queue is full (backpressure), and then for
+        # at most PUT_TIMEOUT seconds.
+        try:
+            self._queue.put((sql, row), timeout=PUT_TIMEOUT)
+        except queue.Full:
+            self._write_directly(sql, row)
+
+    def _write_directly(self, sql, row):
+
+        # The writer thread is stuck or far behind: this record goes to the
+        # database on a connection of its own, or to quarantine.
+
+        logger.error("Results queue still full after %s s; writing a %s row directly",
+                     PUT_TIMEOUT, _TABLES[sql])
+
+        conn = sqlite3.connect(self.path, timeout=PUT_TIMEOUT)
+        try:
+            with conn:
+                conn.execute(sql, row)
+        except sqlite3.Error as exc:
+            self._quarantine([(sql, row, exc)])
+        finally:
+            conn.close()
+
+    # ---------- WRITER THREAD ----------
+
+    def _run_writer(self):
+
+        # Every script run puts records on the queue, so this thread must
+        # outlive anything that goes wrong in it: an unexpected error is
+        # logged and the batch retried later, like a locked database.
+
+        while True:
+            try:
+                if self._writer_step():
+                    return
+            except Exception as exc:
+                self._writer_error(exc)
+
+    def _writer_step(self):
+
+        # One pass of the writer loop; True once the store is closed.
+
+        now = time.monotonic()
+
+        if self._pending_count and now >= self._write_due(now):
+            self._write_pending()
+            return False
+
+        if self._pending_count >= MAX_PENDING:
+            # Waiting to retry with a full buffer: leave the rest on the
+            # queue so memory stays bounded.
+            time.sleep(max(0.0, self._retry_at - now))
+            return False
+
+        timeout = None
+        if self._pending_count:
+            timeout = max(0.0, self._write_due(now) - now)
+
+        try:
+            sql, payload = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return False
+
+        if sql is None:
+            # A drain or close marker: everything queued before it is now
+            # in _pending, so writing that out completes the drain.
+            try:
+                self._write_pending()
+            except Exception as exc:
+                self._writer_error(exc)
+            payload.set()
+            return payload is self._closed
+
+        self._pending[sql].append(payload)
+        self._pending_count += 1
+
+        if self._oldest_pending is None:
+            self._oldest_pending = now
+
+        return False
+
+    def _writer_error(self, exc):
+        logger.exception("Results writer failed; retrying")
+        self._write_failed(exc)
+
+    def _write_due(self, now):
+
+        if self._retry_at is not None:
+            return self._retry_at
+
+        if self._pending_count >= BATCH_SIZE:
+            return now
+
+        return self._oldest_pending + FLUSH_INTERVAL
+
+    def _write_pending(self):
+
+        if not self._pending_count:
+            return
+
+        # Sessions first, so trials and summaries never reference a
+        # session row that is still waiting in the buffer.
+        try:
+            with self._conn:
+                for sql, rows in self._pending.items():
+                    if rows:
+                        self._conn.executemany(sql, rows)
+            rejected = []
+        except sqlite3.OperationalError as exc:
+            # Locked, busy or out of disk: keep the batch and try again
+            # later; the error is reported to whoever drains next.
+            self._write_failed(exc)
+            return
+        except sqlite3.Error:
+            # Some record cannot be written at all. Write the batch row by
+            # row and quarantine the ones that fail.
+            try:
+                rejected = self._write_rows_separately()
+            except sqlite3.OperationalError as exc:
+                self._write_failed(exc)
+                return
+
+        self._quarantine(rejected)
+
+        self._error = None
+        self._failures = 0
+        self._retry_at = None
+
+        for rows in self._pending.values():
+            rows.clear()
+
+        self._pending_count = 0
+        self._oldest_pending = None
+
+    def _write_rows_separately(self):
+
+        rejected = []
+
+        with self._conn:
+            for sql, rows in self._pending.items():
+                for row in rows:
+                    try:
+                        self._conn.execute(sql, row)
+                    except sqlite3.OperationalError:
+                        raise
+                    except sqlite3.Error as exc:
+                        rejected.append((sql, row, exc))
+
+        return rejected
+
+    def _write_failed(self, exc):
+        self._error = exc
+        self._failures += 1
+        delay = min(RETRY_MAX_DELAY, RETRY_DELAY * 2 ** (self._failures - 1))
+        self._retry_at = time.monotonic() + delay
+
+    def _quarantine(self, rejected):
+
+        if not rejected:
+            return
+
+        lines = [
+            json.dumps({"table": _TABLES[sql], "row": row, "error": str(exc)}, default=repr)
+            for sql, row, exc in rejected
+        ]
+
+        # Called from the writer thread and from _write_directly().
+        with self._quarantine_lock:
+            self.quarantined += len(rejected)
+            try:
+                with open(self.quarantine_path, "a") as f:
+                    f.write("".join(line + "\n" for line in lines))
+            except OSError:
+                # Nowhere left to put them but the log.
+                logger.exception("Could not quarantine %d records: %s", len(lines), lines)
+
+    # ---------- FLUSHING ----------
+
+    def drain(self, timeout=DRAIN_TIMEOUT):
+
+        # Wait until every record queued so far is on disk. Called at the end
+        # of a session, never between trials.
+
+        deadline = time.monotonic() + timeout
+        done = threading.Event()
+
+        try:
+            self._queue.put((None, done), timeout=timeout)
+        except queue.Full:
+            done = None
+
+        if done is None or not done.wait(max(0.0, deadline - time.monotonic())):
+            raise TimeoutError(f"Results were not written within {timeout} seconds")
+
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+
+        if not self._writer.is_alive():
+            return
+
+        try:
+            self._queue.put((None, self._closed), timeout=DRAIN_TIMEOUT)
+        except queue.Full:
+            return
+
+        self._writer.join(DRAIN_TIMEOUT)
+
+    # ---------- EXPORT ----------
+
+    def export_csv(self, out_dir):
+
+        self.drain()
+        os.makedirs(out_dir, exist_ok=True)
+
+        written = {}
+
+        # A separate connection, so the export never shares a transaction
+        # with the writer thread.
+        conn = sqlite3.connect(self.path)
+
+        for table in ("sessions", "trials", "summaries"):
+            cursor = conn.execute(f"SELECT * FROM {table}")
+            columns = [c[0] for c in cursor.description]
+
+            out_path = os.path.join(out_dir, f"{table}.csv")
+
+            with open(out_path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+
+                rows = 0
+                while True:
+                    chunk = cursor.fetchmany(5000)
+                    if not chunk:
+                        break
+                    writer.writerows(chunk)
+                    rows += len(chunk)
+
+            written[out_path] = rows
+
+        conn.close()
+
+        return written
+
+
+@st.cache_resource(show_spinner=False)
+def get_results_store(path=DEFAULT_DB_PATH):
+    return ResultsStore(path)
+
+
+# ================= DATASET EXPORT =================
+
+# Trials or sessions for a date range and/or cohort, joined with the
+# demographics, read by keyset pagination and written out chunk by chunk:
+# memory use depends on the chunk size, never on the number of sessions.
+
+def _export_query(table, since, until, cohort):
+
+    conditions, params = [], []
+
+    if since is not None:
+        conditions.append("s.started_at >= ?")
+        params.append(since)
+
+    if until is not None:
+        conditions.append("s.started_at < ?")
+        params.append(until)
+
+    for field, value in (cohort or {}).items():
+        if field not in DEMOGRAPHIC_FIELDS:
+            raise ValueError(f"Unknown demographic field: {field!r}")
+        conditions.append(f"s.{field} = ?")
+        params.append(value)
+
+    demographics = ", ".join(f"s.{field}" for field in DEMOGRAPHIC_FIELDS)
+
+    if table == "trials":
+        key = "t.id"
+        sql = (
+            f"SELECT t.id, {', '.join(f't.{field}' for field in TRIAL_FIELDS)}, "
+            f"s.started_at, s.bank_index, {demographics} "
+            f"FROM trials t JOIN sessions s ON s.session_id = t.session_id"
+        )
+    elif table == "sessions":
+        key = "s.session_id"
+        summaries = ", ".join(
+            f"(SELECT metrics FROM summaries WHERE session_id = s.session_id AND test = '{test}') "
+            f"AS {test}_summary"
+            for test in TESTS
+        )
+        sql = f"SELECT s.session_id, s.started_at, s.bank_index, {demographics}, {summaries} FROM sessions s"
+    else:
+        raise ValueError(f"Unknown export table: {table!r}")
+
+    where = " AND ".join([f"{key} > ?", *conditions])
+
+    return f"{sql} WHERE {where} ORDER BY {key} LIMIT ?", params
+
+
+def iter_export_chunks(db_path, table="trials", since=None, until=None, cohort=None,
+                       chunk_size=EXPORT_CHUNK_SIZE):
+
+    # Yields (columns, rows) with at most chunk_size rows; an empty selection
+    # still yields its columns once. since / until are epoch seconds on the
+    # session start; cohort maps demographic fields to the value they must
+    # have.
+
+    sql, params = _export_query(table, since, until, cohort)
+    last = 0 if table == "trials" else ""
+    first = True
+
+    conn = sqlite3.connect(db_path)
+
+    try:
+        while True:
+            cursor = conn.execute(sql, [last, *params, chunk_size])
+            rows = cursor.fetchall()
+
+            if rows or first:
+                yield [c[0] for c in cursor.description], rows
+
+            if not rows:
+                return
+
+            first = False
+            last = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def _csv_stream(chunks):
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header = True
+
+    for columns, rows in chunks:
+        if header:
+            writer.writerow(columns)
+            header = False
+        writer.writerows(rows)
+
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+class _ChunkSink(io.RawIOBase):
+
+    # A write-only file that hands back whatever was written since the last
+    # take(), so a ParquetWriter's output can be passed on row group by row
+    # group.
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _arrow_type(pa, column):
+    if column in _INTEGER_COLUMNS:
+        return pa.int64()
+    if column in _REAL_COLUMNS:
+        return pa.float64()
+    return pa.string()
+
+
+def _parquet_stream(chunks):
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet export needs the pyarrow package") from e
+
+    sink = _ChunkSink()
+    writer = None
+
+    for columns, rows in chunks:
+        if writer is None:
+            schema = pa.schema([(column, _arrow_type(pa, column)) for column in columns])
+            writer = pq.ParquetWriter(sink, schema)
+
+        writer.write_table(pa.Table.from_pylist(
+            [dict(zip(columns, row)) for row in rows], schema=schema
+        ))
+        yield sink.take()
+
+    if writer is not None:
+        writer.close()
+        yield sink.take()
+
+
+def export_dataset(db_path, table="trials", fmt="csv", since=None, until=None, cohort=None,
+                   chunk_size=EXPORT_CHUNK_SIZE):
+
+    # The export as a stream of bytes chunks.
+
+    chunks = iter_export_chunks(db_path, table, since, until, cohort, chunk_size)
+
+    if fmt == "csv":
+        return _csv_stream(chunks)
+
+    if fmt == "parquet":
+        return _parquet_stream(chunks)
+
+    raise ValueError(f"Unknown export format: {fmt!r}")
+
+
+def write_dataset(out, db_path, **options):
+
+    # Writes export_dataset() to a binary file object; returns bytes written.
+
+    written = 0
+    for data in export_dataset(db_path, **options):
+        out.write(data)
+        written += len(data)
+    return written
+
+
+def day_start(text, days_after=0):
+    # Local midnight of a YYYY-MM-DD date (or of a later day), in epoch seconds.
+    day = datetime.date.fromisoformat(text) + datetime.timedelta(days=days_after)
+    return datetime.datetime.combine(day, datetime.time()).timestamp()
+
+
+# ================= COMMAND LINE =================
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Export stored results.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="write sessions, trials and summaries as CSV")
+    export.add_argument("--db", default=DEFAULT_DB_PATH)
+    export.add_argument("--out", default="export")
+
+    dataset = sub.add_parser(
+        "dataset", help="stream trials or sessions, with demographics, as CSV or Parquet"
+    )
+    dataset.add_argument("--db", default=DEFAULT_DB_PATH)
+    dataset.add_argument("--table", choices=EXPORT_TABLES, default="trials")
+    dataset.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    dataset.add_argument("--since", default=None, help="first session start date, YYYY-MM-DD")
+    dataset.add_argument("--until", default=None, help="last session start date, YYYY-MM-DD")
+    dataset.add_argument(
+        "--cohort", action="append", default=[], metavar="FIELD=VALUE",
+        help="keep sessions with this demographic value; repeat to combine"
+    )
+    dataset.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    dataset.add_argument("--out", required=True, help="output file")
+
+    args = parser.parse_args()
+
+    if args.command == "dataset":
+        # Checked before --out is opened, so a bad filter leaves no file.
+        cohort = {}
+        for item in args.cohort:
+            field, sep, value = item.partition("=")
+            if not sep or field not in DEMOGRAPHIC_FIELDS:
+                dataset.error(
+                    f"--cohort {item!r}: expected FIELD=VALUE with FIELD one of "
+                    f"{', '.join(DEMOGRAPHIC_FIELDS)}"
+                )
+            cohort[field] = value
+
+    if args.command == "export":
+        store = ResultsStore(args.db)
+        for path, rows in store.export_csv(args.out).items():
+            print(f"{path}: {rows} rows")
+
+    elif args.command == "dataset":
+        # Reads the database as it stands; records still queued in a
+        # running app's writer thread are not included.
+        with open(args.out, "wb") as f:
+            written = write_dataset(
+                f, args.db,
+                table=args.table,
+                fmt=args.format,
+                since=day_start(args.since) if args.since else None,
+                until=day_start(args.until, days_after=1) if args.until else None,
+                cohort=cohort,
+                chunk_size=args.chunk_size,
+            )
+        print(f"{args.out}: {written} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+import argparse
+import csv
+import sqlite3
+
+import numpy as np
+
+from math_questions import DIFFICULTIES, QUESTION_POOL_SIZE
+from stroop_questions import CONDITIONS
+
+# Results "test" names. Adaptive math sessions are stored and scored apart
+# from fixed-pool ones: their scores are not on the same scale.
+TESTS = ("math", "math_adaptive", "stroop", "mental")
+
+# Every scorer takes columnar trial records plus a `session` array of
+# integer codes (0 .. n_sessions - 1) and returns one array per metric,
+# indexed by session. A single session is just session = zeros.
+
+MATH_WEIGHTS = {"easy": 1, "moderate": 2, "hard": 3}
+MATH_ACCURACY_WEIGHT = 0.7
+MATH_SPEED_WEIGHT = 0.3
+MATH_SPEED_TARGET = QUESTION_POOL_SIZE
+
+# Adaptive math is scored by where the staircase settles: the mean level
+# over its last STAIRCASE_REVERSALS reversals.
+STAIRCASE_REVERSALS = 6
+
+
+# ================= HELPERS =================
+
+def _grouped_sum(session, n_sessions, weights=None, groups=None, n_groups=1):
+
+    # bincount over (session, group) pairs, reshaped to (n_sessions, n_groups)
+
+    index = session if groups is None else session * n_groups + groups
+    total = np.bincount(index, weights=weights, minlength=n_sessions * n_groups)
+
+    return total.reshape(n_sessions, n_groups) if groups is not None else total
+
+
+def _ratio(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    out = np.full(np.broadcast(numerator, denominator).shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def _n_sessions(session, n_sessions):
+    if n_sessions is not None:
+        return n_sessions
+    return int(session.max()) + 1 if len(session) else 0
+
+
+def encode(values, vocabulary):
+    lookup = {v: i for i, v in enumerate(vocabulary)}
+    return np.fromiter((lookup[v] for v in values), dtype=np.int64, count=len(values))
+
+
+def session_scores(scores, index=0):
+
+    # One session's metrics as plain Python values, NaN mapped to None.
+
+    result = {}
+    for name, values in scores.items():
+        value = values[index].item()
+        result[name] = None if isinstance(value, float) and np.isnan(value) else value
+    return result
+
+
+# ================= MATH =================
+
+def score_math_counts(attempted, correct, weights=MATH_WEIGHTS):
+
+    # attempted / correct: (n_sessions, len(DIFFICULTIES)) answered counts
+
+    attempted = np.atleast_2d(attempted).astype(np.int64)
+    correct = np.atleast_2d(correct).astype(np.int64)
+    w = np.array([weights[d] for d in DIFFICULTIES], dtype=np.float64)
+
+    total_attempted = attempted.sum(axis=1)
+    weighted_accuracy = np.nan_to_num(_ratio(correct @ w, attempted @ w))
+    speed_efficiency = np.minimum(total_attempted / MATH_SPEED_TARGET, 1.0)
+    numerical_score = MATH_ACCURACY_WEIGHT * weighted_accuracy + MATH_SPEED_WEIGHT * speed_efficiency
+
+    answered = total_attempted > 0
+
+    return {
+        "attempted": total_attempted,
+        "correct": correct.sum(axis=1),
+        "weighted_accuracy": np.where(answered, weighted_accuracy, np.nan),
+        "speed_efficiency": np.where(answered, speed_efficiency, np.nan),
+        "numerical_score": np.where(answered, numerical_score, np.nan),
+    }
+
+
+def score_math(session, difficulty, attempted, correct, n_sessions=None, weights=MATH_WEIGHTS):
+
+    # difficulty: codes into DIFFICULTIES; attempted: False for skipped items
+
+    n = _n_sessions(session, n_sessions)
+    k = len(DIFFICULTIES)
+
+    attempted = np.asarray(attempted, dtype=bool)
+    correct = np.asarray(correct, dtype=bool) & attempted
+
+    return score_math_counts(
+        _grouped_sum(session, n, attempted, difficulty, k),
+        _grouped_sum(session, n, correct, difficulty, k),
+        weights
+    )
+
+
+# ================= ADAPTIVE MATH =================
+
+def staircase_reversals(levels):
+
+    # Levels (difficulty codes, in presentation order) at which the
+    # staircase turned round.
+
+    reversals, direction = [], 0
+
+    for previous, level in zip(levels, levels[1:]):
+        step = (level > previous) - (level < previous)
+        if step:
+            if direction and step != direction:
+                reversals.append(previous)
+            direction = step
+
+    return reversals
+
+
+def staircase_level(levels, last=STAIRCASE_REVERSALS):
+
+    # Mean level over the last reversals; a staircase that never turned
+    # round (always right, or always wrong) is scored by every level it
+    # presented.
+
+    if not len(levels):
+        return np.nan
+
+    reversals = staircase_reversals(levels)
+    return float(np.mean(reversals[-last:] if reversals else levels))
+
+
+def score_math_adaptive(session, difficulty, attempted, correct, n_sessions=None):
+
+    # Same inputs as score_math, in presentation order within each session
+    # (skips included: they move the staircase too).
+
+    n = _n_sessions(session, n_sessions)
+
+    session = np.asarray(session)
+    difficulty = np.asarray(difficulty)
+    attempted = np.asarray(attempted, dtype=bool)
+    correct = np.asarray(correct, dtype=bool) & attempted
+
+    order = np.argsort(session, kind="stable")
+    bounds = np.searchsorted(session[order], np.arange(n + 1))
+
+    level = np.full(n, np.nan)
+    reversals = np.zeros(n, dtype=np.int64)
+
+    for i in range(n):
+        levels = difficulty[order[bounds[i]:bounds[i + 1]]].tolist()
+        level[i] = staircase_level(levels)
+        reversals[i] = len(staircase_reversals(levels))
+
+    return {
+        "attempted": _grouped_sum(session, n, attempted).astype(np.int64),
+        "correct": _grouped_sum(session, n, correct).astype(np.int64),
+        "reversals": reversals,
+        "staircase_level": level,
+        "staircase_score": level / (len(DIFFICULTIES) - 1),
+    }
+
+
+# ================= STROOP =================
+
+def score_stroop(session, condition, correct, rt, n_sessions=None):
+
+    # condition: codes into CONDITIONS; rt: seconds, NaN when no response
+
+    n = _n_sessions(session, n_sessions)
+    k = len(CONDITIONS)
+
+    correct = np.asarray(correct, dtype=bool)
+    rt = np.asarray(rt, dtype=np.float64)
+
+    trials = np.bincount(session, minlength=n)
+    errors = trials - _grouped_sum(session, n, correct)
+
+    valid = correct & ~np.isnan(rt)
+    counts = _grouped_sum(session, n, valid, condition, k)
+    sums = _grouped_sum(session, n, np.where(valid, rt, 0.0), condition, k)
+
+    cong_rt = _ratio(sums[:, CONDITIONS.index("Congruent")], counts[:, CONDITIONS.index("Congruent")])
+    incong_rt = _ratio(sums[:, CONDITIONS.index("Incongruent")], counts[:, CONDITIONS.index("Incongruent")])
+
+    return {
+        "trials": trials,
+        "errors": errors.astype(np.int64),
+        "error_rate": np.nan_to_num(_ratio(errors * 100, trials)),
+        "mean_rt": _ratio(sums.sum(axis=1), counts.sum(axis=1)),
+        "congruent_rt": cong_rt,
+        "incongruent_rt": incong_rt,
+        "stroop_effect": incong_rt - cong_rt,
+    }
+
+
+# ================= MENTAL ROTATION =================
+
+def score_mrt(session, correct, rt, timed_out, n_sessions=None):
+
+    n = _n_sessions(session, n_sessions)
+
+    trials = np.bincount(session, minlength=n)
+    correct_count = _grouped_sum(session, n, np.asarray(correct, dtype=bool))
+
+    return {
+        "trials": trials,
+        "correct": correct_count.astype(np.int64),
+        "accuracy": _ratio(correct_count * 100, trials),
+        "avg_time": _ratio(_grouped_sum(session, n, np.asarray(rt, dtype=np.float64)), trials),
+        "timed_out": _grouped_sum(session, n, np.asarray(timed_out, dtype=bool)).astype(np.int64),
+    }
+
+
+# ================= STORED TRIALS =================
+
+def score_trial_columns(test, columns, n_sessions, weights=MATH_WEIGHTS):
+
+    # columns: trial-table columns as arrays (see results_store.TRIAL_FIELDS)
+    # with `session` already encoded as integer codes.
+
+    session = columns["session"]
+
+    if test == "math":
+        return score_math(
+            session,
+            encode(columns["condition"], DIFFICULTIES),
+            np.array([r is not None for r in columns["response"]]),
+            columns["correct"] == 1,
+            n_sessions,
+            weights
+        )
+
+    if test == "math_adaptive":
+        return score_math_adaptive(
+            session,
+            encode(columns["condition"], DIFFICULTIES),
+            np.array([r is not None for r in columns["response"]]),
+            columns["correct"] == 1,
+            n_sessions
+        )
+
+    if test == "stroop":
+        return score_stroop(
+            session,
+            encode(columns["condition"], CONDITIONS),
+            columns["correct"] == 1,
+            columns["rt"],
+            n_sessions
+        )
+
+    if test == "mental":
+        return score_mrt(
+            session,
+            columns["correct"] == 1,
+            columns["rt"],
+            columns["timed_out"] == 1,
+            n_sessions
+        )
+
+    raise ValueError(f"Unknown test: {test}")
+
+
+def read_trial_columns(conn, test, session_ids=None):
+
+    # Returns (session_ids, columns) for one test, optionally limited to the
+    # given sessions; session codes index the returned session_ids. Rows
+    # come in the order they were recorded.
+
+    sql = "SELECT session_id, condition, response, correct, rt, timed_out FROM trials WHERE test = ?"
+    params = [test]
+
+    if session_ids is not None:
+        sql += f" AND session_id IN ({', '.join('?' * len(session_ids))})"
+        params.extend(session_ids)
+
+    sql += " ORDER BY id"
+
+    rows = conn.execute(sql, params).fetchall()
+
+    if not rows:
+        return [], None
+
+    sid, condition, response, correct, rt, timed_out = zip(*rows)
+
+    ids, session = np.unique(np.array(sid), return_inverse=True)
+
+    columns = {
+        "session": session,
+        "condition": condition,
+        "response": response,
+        "correct": np.array([-1 if c is None else c for c in correct]),
+        "rt": np.array(rt, dtype=np.float64),
+        "timed_out": np.array(timed_out),
+    }
+
+    return ids.tolist(), columns
+
+
+def score_database(db_path, weights=MATH_WEIGHTS, session_ids=None):
+
+    # {session_id: {"math_numerical_score": ..., "stroop_error_rate": ...}}
+
+    conn = sqlite3.connect(db_path)
+    scores = {}
+
+    try:
+        for test in TESTS:
+            ids, columns = read_trial_columns(conn, test, session_ids)
+            if columns is None:
+                continue
+
+            metrics = score_trial_columns(test, columns, len(ids), weights)
+
+            for i, session_id in enumerate(ids):
+                row = scores.setdefault(session_id, {})
+                for name, value in session_scores(metrics, i).items():
+                    row[f"{test}_{name}"] = value
+    finally:
+        conn.close()
+
+    return scores
+
+
+# ================= COMMAND LINE =================
+
+def main():
+
+    from results_store import DEFAULT_DB_PATH
+
+    parser = argparse.ArgumentParser(description="Recompute scores for every stored session.")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--out", default="scores.csv")
+    parser.add_argument(
+        "--math-weights", default="1,2,3",
+        help="easy,moderate,hard weights for the weighted math accuracy"
+    )
+
+    args = parser.parse_args()
+
+    weights = dict(zip(DIFFICULTIES, (float(w) for w in args.math_weights.split(","))))
+    scores = score_database(args.db, weights)
+
+    fields = sorted({name for row in scores.values() for name in row})
+
+    with open(args.out, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["session_id", *fields])
+        for session_id, row in scores.items():
+            writer.writerow([session_id, *(row.get(name) for name in fields)])
+
+    print(f"Scored {len(scores)} sessions -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
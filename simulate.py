@@ -0,0 +1,426 @@
+import argparse
+import collections
+import json
+import math
+import os
+import pickle
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import math_test
+from mental_rotation_test import MentalRotationTask
+from question_bank import load_question_bank
+from results_store import ResultsStore
+from scoring import score_trial_columns, session_scores
+from stroop_test import RESPONSES, StroopTask
+from timing import RERUN_SLACK_MS, response_timing
+from trial_engine import apply_response, apply_timeout, finished, remaining, replay, start
+
+# Synthetic participants run through the same TrialTask plugins and step
+# functions as the app, with a virtual clock in place of the real one:
+# waiting out a five-minute block costs nothing, and a run is reproducible
+# from its seed. Every finished stage is rescored from its trial records
+# with scoring.score_trial_columns and compared with the summary the engine
+# showed, so the live formulas and the stored-data formulas cannot drift,
+# and rebuilt from its checkpoints, as a resumed session would be.
+
+STAGES = ("math", "stroop", "mental")
+
+# Summary metrics that both scoring paths produce, per results "test".
+CHECKED_METRICS = {
+    "math": ("attempted", "correct", "weighted_accuracy", "speed_efficiency", "numerical_score"),
+    "math_adaptive": ("attempted", "correct", "reversals", "staircase_level", "staircase_score"),
+    "stroop": ("trials", "errors", "error_rate", "mean_rt", "congruent_rt", "incongruent_rt", "stroop_effect"),
+    "mental": ("trials", "correct", "accuracy", "avg_time", "timed_out"),
+}
+
+# Mean and spread of response times per stage, in seconds.
+RESPONSE_TIMES = {"math": (4.0, 2.0), "stroop": (0.9, 0.3), "mental": (3.5, 1.5)}
+
+# Inputs each task must reject without using up the trial.
+INVALID_INPUTS = {
+    "math": ("abc", "1.5", "1e3", "0x10", "--1"),
+    "stroop": ("red", "PURPLE", ""),
+    "mental": ("C", "a", ""),
+}
+
+PARTICIPANTS_PER_CHUNK = 50
+
+
+# ================= VIRTUAL CLOCK =================
+
+class VirtualClock:
+
+    # ns stands in for timing.now_ns() and wall for time.time(); both move
+    # only when advance() is called.
+
+    def __init__(self, wall_start=0.0):
+        self.ns = 0
+        self.wall_start = wall_start
+
+    @property
+    def wall(self):
+        return self.wall_start + self.ns / 1e9
+
+    def advance(self, seconds):
+        self.ns += int(seconds * 1e9)
+
+
+# ================= PARTICIPANTS =================
+
+def correct_input(stage, trial):
+
+    if stage == "math":
+        return str(trial[1])
+
+    if stage == "stroop":
+        return trial[1].upper()
+
+    return "AB"[[option["correct"] for option in trial[1]].index(True)]
+
+
+def wrong_input(stage, trial, rng):
+
+    if stage == "math":
+        return str(trial[1] + rng.choice((-2, -1, 1, 2)))
+
+    if stage == "stroop":
+        return rng.choice([r for r in RESPONSES if r != trial[1].upper()])
+
+    return "BA"["AB".index(correct_input(stage, trial))]
+
+
+class RandomParticipant:
+
+    # Answers correctly with probability `accuracy`, after a response time
+    # drawn per stage; now and then skips (math), lets a trial time out
+    # (timed tasks) or types something invalid first.
+
+    def __init__(self, seed, accuracy=0.8, skip_rate=0.05, timeout_rate=0.05, invalid_rate=0.05):
+        self.rng = random.Random(seed)
+        self.accuracy = accuracy
+        self.skip_rate = skip_rate
+        self.timeout_rate = timeout_rate
+        self.invalid_rate = invalid_rate
+
+    def respond(self, task, state, trial):
+
+        # (seconds until the input, the raw input), raw None for no input.
+
+        rng = self.rng
+        stage = task.stage
+        mean, sd = RESPONSE_TIMES[stage]
+        delay = max(0.15, rng.gauss(mean, sd))
+
+        if task.time_limit is not None and rng.random() < self.timeout_rate:
+            return delay, None
+
+        if rng.random() < self.invalid_rate:
+            return delay, rng.choice(INVALID_INPUTS[stage])
+
+        if stage == "math" and rng.random() < self.skip_rate:
+            return delay, ""
+
+        if rng.random() < self.accuracy:
+            return delay, correct_input(stage, trial)
+
+        return delay, wrong_input(stage, trial, rng)
+
+
+class ScriptedParticipant:
+
+    # Plays back fixed [seconds, input] pairs per stage; input null waits
+    # for the time limit. Once a stage's script runs out the participant
+    # stops responding.
+
+    def __init__(self, script):
+        self.script = {stage: iter(script.get(stage, ())) for stage in STAGES}
+
+    def respond(self, task, state, trial):
+        return next(self.script[task.stage], (0.0, None))
+
+
+# ================= ENGINE LOOP =================
+
+def run_stage(task, bank_index, clock, participant, recorder, counts):
+
+    # The loop run_task() performs across reruns, without Streamlit: the
+    # clock jumps straight to the participant's input or, if that would come
+    # too late, to the deadline plus the rerun slack.
+
+    state = task.new_state(bank_index)
+    start(task, state, bank_index, clock.ns, clock.wall)
+
+    # What run_task would checkpoint; the state is copied as it started.
+    entries = [("start", pickle.loads(pickle.dumps(state)))]
+
+    while not finished(task, state, clock.wall):
+
+        trial = task.stimulus(state)
+        delay, raw = participant.respond(task, state, trial)
+        left, kind = remaining(task, state, clock.ns, clock.wall)
+
+        if raw is None or (left is not None and delay >= left):
+            if left is None:
+                raise RuntimeError(f"{task.stage}: no input and no time limit to end the trial")
+
+            clock.advance(max(0.0, left) + RERUN_SLACK_MS / 1000)
+
+            if kind == "trial":
+                apply_timeout(task, state, recorder, clock.ns)
+                entries.append(("timeout", clock.wall - state.started_at))
+                counts["timeouts"] += 1
+            continue
+
+        clock.advance(delay)
+
+        try:
+            response = task.parse_response(raw)
+        except ValueError:
+            counts["rejected"] += 1
+            continue
+
+        timing = response_timing(state.onset_ns, response_ns=clock.ns)
+        apply_response(task, state, recorder, response, timing)
+        entries.append(("response", response, timing, clock.wall - state.started_at))
+
+    return task.summary(state), entries
+
+
+def trial_columns(rows):
+
+    # The recorded trials as score_trial_columns expects them from the
+    # database, for a single session.
+
+    return {
+        "session": np.zeros(len(rows), dtype=np.int64),
+        "condition": [row.get("condition") for row in rows],
+        "response": [row.get("response") for row in rows],
+        "correct": np.array([-1 if row["correct"] is None else int(row["correct"]) for row in rows]),
+        "rt": np.array([np.nan if row["rt"] is None else row["rt"] for row in rows], dtype=np.float64),
+        "timed_out": np.array([int(row["timed_out"]) for row in rows]),
+    }
+
+
+def _same(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+
+
+def check_summary(task, summary, rows, entries):
+
+    test = task.test
+    rescored = session_scores(score_trial_columns(test, trial_columns(rows), 1))
+    resumed = task.summary(replay(task, entries)[0])
+
+    return [
+        (f"{source} {metric}", summary.get(metric), other.get(metric))
+        for source, other in (("rescored", rescored), ("resumed", resumed))
+        for metric in CHECKED_METRICS[test]
+        if not _same(summary.get(metric), other.get(metric))
+    ]
+
+
+def run_participant(seed, participant, bank_size, store=None):
+
+    # One participant through all three tasks. Returns the per-stage
+    # summaries, event counts and any scoring mismatches.
+
+    session_id = f"sim-{seed}"
+    bank_index = seed % bank_size
+    clock = VirtualClock()
+    counts = collections.Counter()
+
+    # MentalRotationTask draws its trial order from the global random module.
+    random.seed(seed)
+
+    if store is not None:
+        store.record_session(session_id, {"name": session_id}, bank_index, started_at=clock.wall)
+
+    summaries, mismatches = {}, []
+
+    for task in (math_test.MathTask(), StroopTask(), MentalRotationTask()):
+
+        rows = []
+
+        def record(test, trial_no, **fields):
+            rows.append(fields)
+            if store is not None:
+                store.record_trial(session_id, test, trial_no, **fields)
+
+        summary, entries = run_stage(task, bank_index, clock, participant, record, counts)
+
+        counts["trials"] += len(rows)
+        counts["skips"] += sum(1 for row in rows if row["correct"] is None)
+
+        summaries[task.test] = summary
+        mismatches.extend(
+            (session_id, task.test, *m) for m in check_summary(task, summary, rows, entries)
+        )
+
+        if store is not None:
+            store.record_summary(session_id, task.test, summary)
+
+    return summaries, counts, mismatches
+
+
+# ================= WORKERS =================
+
+def simulate_chunk(seeds, options):
+
+    # Runs in a worker process; returns aggregates only, so the result size
+    # does not grow with the number of participants.
+
+    math_test.ADAPTIVE = options["adaptive"]
+
+    bank_size = len(load_question_bank())
+    store = ResultsStore(options["db"]) if options["db"] else None
+
+    counts = collections.Counter()
+    metrics = {}
+    mismatches = []
+
+    start_time = time.perf_counter()
+
+    for seed in seeds:
+        participant = RandomParticipant(
+            seed, options["accuracy"], options["skip_rate"],
+            options["timeout_rate"], options["invalid_rate"]
+        )
+        summaries, participant_counts, participant_mismatches = run_participant(
+            seed, participant, bank_size, store
+        )
+
+        counts.update(participant_counts)
+        mismatches.extend(participant_mismatches)
+
+        for test, summary in summaries.items():
+            for metric in CHECKED_METRICS[test]:
+                value = summary.get(metric)
+                if value is not None:
+                    acc = metrics.setdefault(f"{test}_{metric}", [0, 0.0])
+                    acc[0] += 1
+                    acc[1] += value
+
+    engine_seconds = time.perf_counter() - start_time
+
+    if store is not None:
+        store.drain()
+
+    return {
+        "participants": len(seeds),
+        "engine_seconds": engine_seconds,
+        "counts": counts,
+        "metrics": metrics,
+        "mismatches": mismatches,
+    }
+
+
+def run_simulation(participants, options, workers=None, seed=0, chunk_size=PARTICIPANTS_PER_CHUNK):
+
+    workers = workers or os.cpu_count() or 1
+    seeds = list(range(seed, seed + participants))
+    chunks = [seeds[i:i + chunk_size] for i in range(0, len(seeds), chunk_size)]
+
+    start_time = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(simulate_chunk, chunks, [options] * len(chunks)))
+
+    wall_time = time.perf_counter() - start_time
+
+    counts = collections.Counter()
+    metrics = {}
+    mismatches = []
+    engine_seconds = 0.0
+
+    for result in results:
+        counts.update(result["counts"])
+        mismatches.extend(result["mismatches"])
+        engine_seconds += result["engine_seconds"]
+        for name, (n, total) in result["metrics"].items():
+            acc = metrics.setdefault(name, [0, 0.0])
+            acc[0] += n
+            acc[1] += total
+
+    return {
+        "participants": participants,
+        "workers": workers,
+        "wall_time_s": wall_time,
+        "participants_per_s": participants / wall_time if wall_time else None,
+        "trials_per_s": counts["trials"] / wall_time if wall_time else None,
+        "engine_us_per_trial": 1e6 * engine_seconds / counts["trials"] if counts["trials"] else None,
+        "counts": dict(counts),
+        "mean_metrics": {name: total / n for name, (n, total) in sorted(metrics.items())},
+        "mismatches": len(mismatches),
+        "first_mismatches": mismatches[:20],
+    }
+
+
+# ================= COMMAND LINE =================
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Run synthetic participants through the test engines on a virtual clock."
+    )
+    parser.add_argument("--participants", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=PARTICIPANTS_PER_CHUNK)
+    parser.add_argument("--accuracy", type=float, default=0.8)
+    parser.add_argument("--skip-rate", type=float, default=0.05, help="blank math answers")
+    parser.add_argument("--timeout-rate", type=float, default=0.05, help="unanswered timed trials")
+    parser.add_argument("--invalid-rate", type=float, default=0.05, help="rejected inputs")
+    parser.add_argument("--adaptive", action="store_true", help="run math as a staircase")
+    parser.add_argument("--db", default=None, help="also record the sessions in this results database")
+    parser.add_argument(
+        "--script", default=None,
+        help='JSON file of {"math": [[seconds, input], ...], ...} for one scripted participant'
+    )
+    parser.add_argument("--out", default=None, help="write the JSON report here")
+
+    args = parser.parse_args()
+
+    if args.script:
+        math_test.ADAPTIVE = args.adaptive
+        with open(args.script) as f:
+            participant = ScriptedParticipant(json.load(f))
+        store = ResultsStore(args.db) if args.db else None
+
+        summaries, counts, mismatches = run_participant(
+            args.seed, participant, len(load_question_bank()), store
+        )
+        if store is not None:
+            store.drain()
+
+        report = {"summaries": summaries, "counts": dict(counts), "mismatches": mismatches}
+    else:
+        options = {
+            "accuracy": args.accuracy,
+            "skip_rate": args.skip_rate,
+            "timeout_rate": args.timeout_rate,
+            "invalid_rate": args.invalid_rate,
+            "adaptive": args.adaptive,
+            "db": args.db,
+        }
+        report = run_simulation(args.participants, options, args.workers, args.seed, args.chunk_size)
+        report["config"] = vars(args)
+
+    text = json.dumps(report, indent=2, default=str)
+    print(text)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+    if report["mismatches"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import streamlit as st
+
+from profiler import count
+from state_backend import clear_checkpoints
+
+# Each test keeps all of its progress in one slotted object stored under a
+# single session-state key. advance_stage() drops every such object (with
+# the test's timer widget keys and its checkpoints) before switching stage,
+# so nothing from a finished test outlives it; only the `scores` dict
+# carries results on.
+
+
+# ================= STATE OBJECTS =================
+
+class StageState:
+
+    __slots__ = ()
+
+    # Keyed widgets owned by the stage, released together with the state.
+    widget_keys = ()
+
+    def __setattr__(self, name, value):
+        count("stage_state_writes")
+        object.__setattr__(self, name, value)
+
+    @classmethod
+    def _all_slots(cls):
+        return [name for klass in cls.__mro__ for name in getattr(klass, "__slots__", ())]
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self._all_slots() if hasattr(self, name)}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+
+class TrialState(StageState):
+
+    # What the trial engine itself tracks for every task.
+
+    # `summary` is set once, the first time the task is found finished.
+
+    __slots__ = ("started", "trial", "onset_ns", "started_at", "summary")
+
+    def __init__(self):
+        self.started = False
+        self.trial = 0
+        self.onset_ns = None
+        self.started_at = None
+        self.summary = None
+
+
+class MathState(TrialState):
+
+    __slots__ = (
+        "questions", "correct_count", "attempted", "difficulty_stats",
+        "current", "level", "streak", "rng", "history",
+    )
+
+    widget_keys = ("math_timer", "math_countdown")
+
+    # Adaptive mode passes questions=None and an rng; the next item is then
+    # generated into `current` after every response, and `history` keeps
+    # (difficulty code, attempted, correct) per item for the staircase score.
+    def __init__(self, questions, rng=None, level=0):
+        super().__init__()
+        self.questions = questions
+        self.correct_count = 0
+        self.attempted = 0
+        self.difficulty_stats = {
+            "low_attempted": 0,
+            "moderate_attempted": 0,
+            "high_attempted": 0,
+            "low_correct": 0,
+            "moderate_correct": 0,
+            "high_correct": 0,
+        }
+        self.current = None
+        self.level = level
+        self.streak = 0
+        self.rng = rng
+        self.history = []
+
+
+class StroopState(TrialState):
+
+    __slots__ = ("results", "trials")
+
+    widget_keys = ("stroop_timer", "stroop_time_bar", "stroop_response", "stroop_runner")
+
+    def __init__(self, results):
+        super().__init__()
+        self.results = results
+        self.trials = None
+
+
+class MentalState(TrialState):
+
+    # options: the shuffled (correct, wrong) pair for every trial, drawn up
+    # front so the browser-side runner and the server agree on them.
+
+    __slots__ = ("results", "randomized", "options")
+
+    widget_keys = ("mental_timer", "mental_time_bar", "mental_response", "mrt_runner")
+
+    def __init__(self, randomized, options):
+        super().__init__()
+        self.results = []
+        self.randomized = randomized
+        self.options = options
+
+
+STATE_KEYS = {
+    "math": "math_state",
+    "stroop": "stroop_state",
+    "mental": "mental_state",
+}
+
+
+# ================= LIFETIME =================
+
+def stage_state(stage, factory):
+
+    # The stage's state object, created on first use.
+
+    key = STATE_KEYS[stage]
+
+    if key not in st.session_state:
+        st.session_state[key] = factory()
+
+    return st.session_state[key]
+
+
+def release_stage_states():
+
+    for key in STATE_KEYS.values():
+        state = st.session_state.pop(key, None)
+        if state is not None:
+            for widget_key in state.widget_keys:
+                st.session_state.pop(widget_key, None)
+
+
+def advance_stage(next_stage, **scores):
+
+    if scores:
+        st.session_state.setdefault("scores", {}).update(scores)
+
+    release_stage_states()
+    clear_checkpoints(st.session_state.current_stage)
+
+    st.session_state.current_stage = next_stage
+    st.rerun()
+
@@ -0,0 +1,424 @@
+import atexit
+import collections
+import hashlib
+import hmac
+import logging
+import os
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Where in-progress sessions are kept so a reconnecting session, or any
+# worker process, can pick them up: "none" (the default) keeps everything in
+# st.session_state only; "sqlite" or "sqlite:///path/to/state.db" uses a
+# local file that every worker on the machine shares; "redis://host:port/db"
+# uses Redis (needs the redis package).
+STATE_BACKEND = os.environ.get("RP_STATE_BACKEND", "none")
+
+DEFAULT_STATE_DB = os.path.join(BASE_DIR, "results", "state.db")
+
+# Key for signing resume tokens. Workers that share a backend need the same
+# key; without RP_RESUME_SECRET one is generated next to the state database,
+# which covers workers on one machine.
+RESUME_SECRET = os.environ.get("RP_RESUME_SECRET", "")
+
+DEFAULT_SECRET_PATH = os.path.join(BASE_DIR, "results", "resume_secret")
+
+# Saved sessions and checkpoints are dropped after this long without an
+# update: Redis expires them, the SQLite backend sweeps them out.
+SESSION_TTL = 7 * 24 * 3600
+
+# Seconds between sweeps of the SQLite backend.
+SWEEP_INTERVAL = 3600
+
+# Writes the SQLite backend may hold before callers block.
+QUEUE_SIZE = 10_000
+
+# Longest a read waits for the same session's queued writes.
+READ_WAIT = 5.0
+
+# The URL query parameter that carries the signed resume token.
+RESUME_PARAM = "resume"
+
+# Where a session is and who it is. These change only between stages; the
+# progress inside a test is checkpointed trial by trial instead (see
+# checkpoint()).
+PERSISTED_KEYS = (
+    "current_stage", "stage_lock", "heartbeat", "session_id", "bank_index",
+    "demographics", "scores",
+)
+
+logger = logging.getLogger(__name__)
+
+
+# ================= BACKENDS =================
+
+# A backend stores one opaque blob per session id: load(session_id)
+# returns it (or None), save(session_id, blob) replaces it. Alongside it,
+# each (session, stage) has an append-only list of checkpoint blobs:
+# append(session_id, stage, blob, reset) adds one, starting the list over
+# when reset is set, entries(session_id, stage) returns them in order and
+# clear(session_id, stage) drops them once the stage is over.
+
+class SQLiteStateBackend:
+
+    # Writes never wait on the disk: they go on a queue that one writer
+    # thread applies in order, so a checkpoint costs a response no more than
+    # a pickle. A read first waits for that session's own queued writes
+    # (never for other sessions'), so this process always sees them; other
+    # workers see them a moment later.
+
+    def __init__(self, path=DEFAULT_STATE_DB, queue_size=QUEUE_SIZE):
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._next_sweep = 0.0
+
+        # Writes queued but not yet applied, per session id.
+        self._pending = collections.Counter()
+        self._applied = threading.Condition()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS session_state ("
+            "session_id TEXT PRIMARY KEY, state BLOB, updated_at REAL);"
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "id INTEGER PRIMARY KEY, session_id TEXT NOT NULL, stage TEXT NOT NULL, "
+            "entry BLOB, recorded_at REAL);"
+            "CREATE INDEX IF NOT EXISTS checkpoints_session ON checkpoints (session_id, stage);"
+        )
+
+        self._writer = threading.Thread(
+            target=self._run_writer, name="state-writer", daemon=True
+        )
+        self._writer.start()
+
+        atexit.register(self.flush)
+
+    # ---------- READS ----------
+
+    def load(self, session_id):
+        self._wait_for(session_id)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM session_state WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def entries(self, session_id, stage):
+        self._wait_for(session_id)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entry FROM checkpoints WHERE session_id = ? AND stage = ? ORDER BY id",
+                (session_id, stage)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _wait_for(self, session_id, timeout=READ_WAIT):
+        with self._applied:
+            self._applied.wait_for(lambda: not self._pending[session_id], timeout)
+
+    # ---------- WRITES ----------
+
+    def save(self, session_id, blob):
+        self._put(session_id, self._save, (session_id, blob, time.time()))
+
+    def append(self, session_id, stage, blob, reset=False):
+        self._put(session_id, self._append, (session_id, stage, blob, reset, time.time()))
+
+    def clear(self, session_id, stage):
+        self._put(session_id, self._clear, (session_id, stage))
+
+    def flush(self):
+        # Everything queued so far, for all sessions; only at exit.
+        self._queue.join()
+
+    def _put(self, session_id, write, args):
+        with self._applied:
+            self._pending[session_id] += 1
+        self._queue.put((session_id, write, args))
+
+    def _save(self, session_id, blob, updated_at):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO session_state (session_id, state, updated_at) "
+            "VALUES (?, ?, ?)",
+            (session_id, blob, updated_at)
+        )
+
+    def _append(self, session_id, stage, blob, reset, recorded_at):
+        if reset:
+            self._clear(session_id, stage)
+        self._conn.execute(
+            "INSERT INTO checkpoints (session_id, stage, entry, recorded_at) "
+            "VALUES (?, ?, ?, ?)",
+            (session_id, stage, blob, recorded_at)
+        )
+
+    def _clear(self, session_id, stage):
+        self._conn.execute(
+            "DELETE FROM checkpoints WHERE session_id = ? AND stage = ?",
+            (session_id, stage)
+        )
+
+    def _sweep(self, now):
+        cutoff = now - SESSION_TTL
+        self._conn.execute("DELETE FROM session_state WHERE updated_at < ?", (cutoff,))
+        self._conn.execute("DELETE FROM checkpoints WHERE recorded_at < ?", (cutoff,))
+        self._next_sweep = now + SWEEP_INTERVAL
+
+    # ---------- WRITER THREAD ----------
+
+    def _run_writer(self):
+
+        while True:
+            session_id, write, args = self._queue.get()
+
+            try:
+                with self._lock, self._conn:
+                    write(*args)
+                    now = time.time()
+                    if now >= self._next_sweep:
+                        self._sweep(now)
+            except Exception:
+                # A lost checkpoint only shortens what a resume can replay;
+                # it must not hold up the writes queued behind it.
+                logger.exception("Could not write session state to %s", self.path)
+            finally:
+                with self._applied:
+                    self._pending[session_id] -= 1
+                    if not self._pending[session_id]:
+                        del self._pending[session_id]
+                    self._applied.notify_all()
+                self._queue.task_done()
+
+
+class RedisStateBackend:
+
+    def __init__(self, url, ttl=SESSION_TTL):
+
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError(
+                "RP_STATE_BACKEND points at Redis but the redis package is not installed"
+            ) from e
+
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+
+    def _key(self, session_id):
+        return f"rp:state:{session_id}"
+
+    def load(self, session_id):
+        return self._client.get(self._key(session_id))
+
+    def save(self, session_id, blob):
+        self._client.set(self._key(session_id), blob, ex=self.ttl)
+
+    def _log_key(self, session_id, stage):
+        return f"rp:checkpoints:{session_id}:{stage}"
+
+    def append(self, session_id, stage, blob, reset=False):
+        key = self._log_key(session_id, stage)
+        pipe = self._client.pipeline()
+        if reset:
+            pipe.delete(key)
+        pipe.rpush(key, blob)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def entries(self, session_id, stage):
+        return self._client.lrange(self._log_key(session_id, stage), 0, -1)
+
+    def clear(self, session_id, stage):
+        self._client.delete(self._log_key(session_id, stage))
+
+
+def open_state_backend(spec):
+
+    if not spec or spec == "none":
+        return None
+
+    if spec == "sqlite":
+        return SQLiteStateBackend()
+
+    if spec.startswith("sqlite:///"):
+        return SQLiteStateBackend(spec[len("sqlite:///"):])
+
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateBackend(spec)
+
+    raise ValueError(f"Unknown RP_STATE_BACKEND: {spec!r}")
+
+
+@st.cache_resource(show_spinner=False)
+def get_state_backend(spec=STATE_BACKEND):
+    return open_state_backend(spec)
+
+
+# ================= RESUME TOKENS =================
+
+def _read_or_create_secret(path):
+
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    try:
+        with open(path, "xb") as f:
+            secret = os.urandom(32)
+            f.write(secret)
+            return secret
+    except FileExistsError:
+        # Another worker created it first.
+        with open(path, "rb") as f:
+            return f.read()
+
+
+@st.cache_resource(show_spinner=False)
+def resume_secret(secret=RESUME_SECRET, path=DEFAULT_SECRET_PATH):
+    return secret.encode() if secret else _read_or_create_secret(path)
+
+
+def _signature(session_id, secret):
+    return hmac.new(secret, session_id.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def make_resume_token(session_id, secret=None):
+    secret = secret or resume_secret()
+    return f"{session_id}.{_signature(session_id, secret)}"
+
+
+def read_resume_token(token, secret=None):
+
+    # The session id a token was issued for, or None if it was not signed
+    # with our key.
+
+    session_id, _, signature = (token or "").partition(".")
+    secret = secret or resume_secret()
+
+    if not session_id or not hmac.compare_digest(signature, _signature(session_id, secret)):
+        return None
+
+    return session_id
+
+
+# ================= SESSION SYNC =================
+
+def restore_session():
+
+    # Before the session is initialised: a fresh session whose URL carries
+    # a valid resume token takes over that session's saved state, wherever
+    # it was last served. Test progress is rebuilt later, by the test
+    # itself, from its checkpoints. Returns True when it did.
+
+    backend = get_state_backend()
+
+    if backend is None or "session_id" in st.session_state:
+        return False
+
+    session_id = read_resume_token(st.query_params.get(RESUME_PARAM))
+    if not session_id:
+        return False
+
+    blob = backend.load(session_id)
+    if blob is None:
+        return False
+
+    for key, value in pickle.loads(blob).items():
+        st.session_state[key] = value
+
+    # The one stage whose progress may be replayed (see load_checkpoint()).
+    st.session_state.resumed_stage = st.session_state.get("current_stage")
+
+    return True
+
+
+def persist_session():
+
+    # Once per script run, after initialisation. Every stage change in the
+    # app ends in st.rerun(), so saving at the top of each run captures it
+    # before anything else can happen. Unchanged state is not written again.
+
+    backend = get_state_backend()
+
+    if backend is None:
+        return
+
+    session_id = st.session_state.session_id
+
+    if "resume_token" not in st.session_state:
+        st.session_state.resume_token = make_resume_token(session_id)
+
+    if st.query_params.get(RESUME_PARAM) != st.session_state.resume_token:
+        st.query_params[RESUME_PARAM] = st.session_state.resume_token
+
+    blob = pickle.dumps({
+        key: st.session_state[key] for key in PERSISTED_KEYS if key in st.session_state
+    })
+
+    digest = hash(blob)
+    if st.session_state.get("persisted_digest") == digest:
+        return
+
+    backend.save(session_id, blob)
+    st.session_state.persisted_digest = digest
+
+
+# ================= CHECKPOINTS =================
+
+def checkpoint(stage, entry, reset=False):
+
+    # Appends one entry to the stage's checkpoint list: a constant-size
+    # write per trial, whatever the length of the test so far.
+
+    backend = get_state_backend()
+
+    if backend is None:
+        return
+
+    backend.append(st.session_state.session_id, stage, pickle.dumps(entry), reset)
+
+
+def load_checkpoint(stage):
+
+    # Only a session taken over by restore_session() has checkpoints to
+    # replay, and only for the stage it was at; every other session starts
+    # its tests without touching the backend.
+
+    backend = get_state_backend()
+
+    if backend is None or st.session_state.get("resumed_stage") != stage:
+        return []
+
+    del st.session_state.resumed_stage
+
+    return [pickle.loads(blob) for blob in backend.entries(st.session_state.session_id, stage)]
+
+
+def clear_checkpoints(stage):
+
+    # Called when a stage is left: its checkpoints can never be replayed
+    # again.
+
+    backend = get_state_backend()
+
+    if backend is None or "session_id" not in st.session_state:
+        return
+
+    backend.clear(st.session_state.session_id, stage)
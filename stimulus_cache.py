@@ -0,0 +1,352 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+
+import streamlit as st
+from PIL import Image, ImageChops
+
+DISPLAY_WIDTH = 175
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_ASSET_DIR = os.path.join(BASE_DIR, "assets")
+ASSET_MANIFEST = "manifest.json"
+
+# Pixel widths of the prebuilt variants. Every variant is shown at
+# DISPLAY_WIDTH CSS pixels. Phones get exactly that, the fewest bytes per
+# trial on the mobile connections most participants use; larger screens
+# get sharper images, up to the 300 px of the sources. Nothing is scaled
+# up past the source images.
+VARIANT_WIDTHS = {"mobile": DISPLAY_WIDTH, "tablet": 262, "desktop": 300}
+DEFAULT_VARIANT = "desktop"
+
+# The consent form's "Device Used" answers.
+DEVICE_VARIANTS = {
+    "Mobile": "mobile",
+    "Tablet": "tablet",
+    "Laptop": "desktop",
+    "Desktop": "desktop",
+}
+
+# Mental rotation stimuli, one (target, correct, wrong) triple per item.
+IMAGE_SETS = (
+    ("images/target1.png", "images/correct1.png", "images/wrong1.png"),
+    ("images/target2.png", "images/correct2.png", "images/wrong2.png"),
+    ("images/target3.png", "images/correct3.png", "images/wrong3.png"),
+    ("images/target4.png", "images/correct4.png", "images/wrong4.png"),
+    ("images/target5.png", "images/correct5.png", "images/wrong5.png"),
+    ("images/target6.png", "images/correct6.png", "images/wrong6.png"),
+    ("images/target7.png", "images/correct7.png", "images/wrong7.png"),
+    ("images/target8.png", "images/correct8.png", "images/wrong8.png"),
+    ("images/target9.png", "images/correct9.png", "images/wrong9.png"),
+    ("images/target10.png", "images/correct10.png", "images/wrong10.png"),
+    ("images/target11.png", "images/correct11.png", "images/wrong11.png"),
+    ("images/target12.png", "images/correct12.png", "images/wrong12.png"),
+    ("images/target13.png", "images/correct13.png", "images/wrong13.png"),
+    ("images/target14.png", "images/correct14.png", "images/wrong14.png"),
+    ("images/target15.png", "images/correct15.png", "images/wrong15.png"),
+)
+
+
+class StimulusLoadError(Exception):
+    pass
+
+
+def variant_for_device(device):
+    return DEVICE_VARIANTS.get(device, DEFAULT_VARIANT)
+
+
+# ================= RENDERING =================
+
+def _open_image(path):
+
+    with open(os.path.join(BASE_DIR, path), "rb") as f:
+        raw = f.read()
+
+    image = Image.open(io.BytesIO(raw))
+    image.load()  # full decode, so truncated or corrupt files fail here
+
+    return image
+
+
+def variant_size(image_set, variant):
+
+    # One size for the whole (target, correct, wrong) triple, taken from
+    # the target, so the three always appear at the same scale.
+
+    with Image.open(os.path.join(BASE_DIR, image_set[0])) as target:
+        width, height = target.size
+
+    scaled = min(VARIANT_WIDTHS[variant], width)
+    return scaled, round(height * scaled / width)
+
+
+def _grey(image):
+    red, green, blue = image.split()
+    return (
+        ImageChops.difference(red, green).getbbox() is None
+        and ImageChops.difference(green, blue).getbbox() is None
+    )
+
+
+def _exact_palette(image, max_colors):
+
+    # A palette image with exactly the same pixels, or None when there are
+    # more than max_colors distinct values.
+
+    colors = image.getcolors(max_colors)
+    if colors is None:
+        return None, None
+
+    palette = [color for _, color in colors]
+    lookup = {color: i for i, color in enumerate(palette)}
+
+    if image.mode == "L":
+        rgb = [(v, v, v) for v in palette]
+    else:
+        rgb = [color[:3] for color in palette]
+
+    indexed = Image.new("P", image.size)
+    indexed.putpalette([channel for color in rgb for channel in color])
+    indexed.putdata([lookup[pixel] for pixel in image.getdata()])
+
+    alpha = bytes(color[3] for color in palette) if image.mode == "RGBA" else None
+    return indexed, alpha
+
+
+def _encode(image, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True, **options)
+    return buffer.getvalue()
+
+
+def _lossless_png(image):
+
+    # The smallest lossless encoding: few-colour images become palette
+    # images. A greyscale PNG is already one byte per pixel; a palette
+    # only pays off below that.
+
+    indexed, alpha = _exact_palette(image, 16 if image.mode == "L" else 256)
+
+    if indexed is None:
+        return _encode(image)
+
+    if alpha is None:
+        return _encode(indexed)
+
+    return _encode(indexed, transparency=alpha)
+
+
+def _source_colors(resized, source):
+
+    # The resized image mapped back onto the source's own colours (all of
+    # them when it has at most 256), without the intermediate levels
+    # resampling adds along every edge.
+
+    if source.mode == "RGBA":
+        # Pillow maps only RGB and L images onto a given palette.
+        return resized.quantize(256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+
+    # Greyscale goes through RGB too: mapped onto a palette directly, an L
+    # image picks up levels the source never had.
+    palette = source.convert("RGB").quantize(256, dither=Image.Dither.NONE)
+    return resized.convert("RGB").quantize(palette=palette, dither=Image.Dither.NONE)
+
+
+def render_stimulus(path, size):
+
+    # PNG bytes of one stimulus at `size`. Alpha is dropped when fully
+    # opaque and colour when every pixel is grey. At the source size the
+    # image is stored losslessly; a resized one also in the source's
+    # colours, and whichever of the two encodings is smaller is kept.
+
+    image = _open_image(path).convert("RGBA")
+
+    if image.getextrema()[3] == (255, 255):
+        image = image.convert("RGB")
+        if _grey(image):
+            image = image.convert("L")
+
+    if image.size == size:
+        return _lossless_png(image)
+
+    resized = image.resize(size, resample=Image.LANCZOS)
+
+    return min(_lossless_png(resized), _encode(_source_colors(resized, image)), key=len)
+
+
+# ================= PREBUILT ASSETS =================
+
+def read_asset_manifest(asset_dir=DEFAULT_ASSET_DIR):
+
+    path = os.path.join(asset_dir, ASSET_MANIFEST)
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def _read_asset(asset_dir, entry):
+
+    with open(os.path.join(asset_dir, entry["file"]), "rb") as f:
+        data = f.read()
+
+    if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+        raise ValueError("checksum does not match the asset manifest")
+
+    return data
+
+
+# ================= PROCESS-WIDE CACHE =================
+
+def _load_error(errors):
+    return StimulusLoadError("Could not load stimulus images:\n" + "\n".join(errors))
+
+
+def _check_sources(image_sets):
+
+    errors = []
+
+    for path in dict.fromkeys(path for image_set in image_sets for path in image_set):
+        try:
+            _open_image(path)
+        except OSError as e:
+            errors.append(f"{path}: {e}")
+
+    return errors
+
+
+def _check_assets(image_sets, asset_dir):
+
+    # Every prebuilt file of every variant against its manifest checksum.
+
+    manifest = read_asset_manifest(asset_dir)
+
+    if manifest is None:
+        return []
+
+    errors = []
+
+    for path in dict.fromkeys(path for image_set in image_sets for path in image_set):
+        if path not in manifest["images"]:
+            continue
+        for variant in VARIANT_WIDTHS:
+            try:
+                _read_asset(asset_dir, manifest["images"][path][variant])
+            except (OSError, ValueError, KeyError) as e:
+                errors.append(f"{path} ({variant}): {e}")
+
+    return errors
+
+
+def _build_variant(image_sets, variant, asset_dir):
+
+    # Prebuilt files (python build_assets.py) are used when present;
+    # without them the same bytes are rendered here.
+
+    manifest = read_asset_manifest(asset_dir)
+
+    stimuli = {}
+    errors = []
+
+    for image_set in image_sets:
+        try:
+            size = variant_size(image_set, variant)
+        except OSError as e:
+            errors.append(f"{image_set[0]}: {e}")
+            continue
+
+        for path in image_set:
+            if path in stimuli:
+                continue
+            try:
+                if manifest is not None and path in manifest["images"]:
+                    stimuli[path] = _read_asset(asset_dir, manifest["images"][path][variant])
+                else:
+                    stimuli[path] = render_stimulus(path, size)
+            except (OSError, ValueError, KeyError) as e:
+                errors.append(f"{path}: {e}")
+
+    if errors:
+        raise _load_error(errors)
+
+    return stimuli
+
+
+class StimulusCache:
+
+    # Every variant of every stimulus, shared by the whole process. Source
+    # images and prebuilt assets are checked before it is created; the
+    # variants are then built one by one on a background thread, which is
+    # done long before the first participant gets through the math and
+    # Stroop tests.
+
+    def __init__(self, image_sets, asset_dir=DEFAULT_ASSET_DIR):
+        self.image_sets = image_sets
+        self.asset_dir = asset_dir
+        self.error = None
+        self._variants = {}
+        self._ready = {variant: threading.Event() for variant in VARIANT_WIDTHS}
+        self._thread = threading.Thread(
+            target=self._build_all, name="stimulus-build", daemon=True
+        )
+        self._thread.start()
+
+    def _build_all(self):
+        for variant, ready in self._ready.items():
+            try:
+                self._variants[variant] = _build_variant(self.image_sets, variant, self.asset_dir)
+            except StimulusLoadError as e:
+                self.error = e
+            ready.set()
+
+    def get(self, variant):
+        # Waits only while that variant is still being built.
+        self._ready[variant].wait()
+        if variant not in self._variants:
+            raise self.error
+        return self._variants[variant]
+
+
+@st.cache_resource(show_spinner=False)
+def get_stimulus_cache(image_sets, asset_dir=DEFAULT_ASSET_DIR):
+
+    errors = _check_sources(image_sets) + _check_assets(image_sets, asset_dir)
+
+    if errors:
+        raise _load_error(errors)
+
+    return StimulusCache(image_sets, asset_dir)
+
+
+def check_stimuli(image_sets):
+
+    # Once per script run, before any page is drawn: a missing or corrupt
+    # source image or prebuilt asset, or a variant that failed to build,
+    # is reported before anyone reaches the task.
+
+    cache = get_stimulus_cache(image_sets)
+
+    if cache.error is not None:
+        raise cache.error
+
+
+def load_stimuli(image_sets, variant=DEFAULT_VARIANT):
+    return get_stimulus_cache(image_sets).get(variant)
+
+
+@st.cache_resource(show_spinner=False)
+def load_stimulus_uris(image_sets, variant=DEFAULT_VARIANT):
+
+    # The same images as data URIs, for components that show them without
+    # fetching anything.
+
+    return {
+        path: "data:image/png;base64," + base64.b64encode(data).decode("ascii")
+        for path, data in load_stimuli(image_sets, variant).items()
+    }
@@ -0,0 +1,65 @@
+import numpy as np
+
+TOTAL_QUESTIONS = 42
+
+COLORS = {
+    "RED": "red",
+    "GREEN": "green",
+    "BLUE": "blue",
+    "YELLOW": "yellow"
+}
+
+NEUTRAL_WORDS = ["DOG", "CAR", "TREE", "HOUSE"]
+
+CONDITIONS = ("Congruent", "Incongruent", "Neutral")
+
+# Integer codes: words index WORDS (colour words first), colours index
+# COLOR_VALUES, conditions index CONDITIONS.
+WORDS = tuple(COLORS.keys()) + tuple(NEUTRAL_WORDS)
+COLOR_VALUES = tuple(COLORS.values())
+
+
+# ================= SEQUENCE GENERATOR =================
+
+def sample_stroop_sequences(num_sequences, length=TOTAL_QUESTIONS, seed=None):
+
+    # Same distribution as drawing one trial at a time: condition uniform,
+    # then a uniform word, and for incongruent trials a uniform colour
+    # other than the word's own.
+
+    rng = np.random.default_rng(seed)
+    shape = (num_sequences, length)
+    n_colors = len(COLOR_VALUES)
+
+    condition = rng.integers(len(CONDITIONS), size=shape)
+    color_word = rng.integers(n_colors, size=shape)
+    neutral_word = rng.integers(len(NEUTRAL_WORDS), size=shape)
+    offset = rng.integers(1, n_colors, size=shape)
+    free_color = rng.integers(n_colors, size=shape)
+
+    neutral = condition == CONDITIONS.index("Neutral")
+
+    word = np.where(neutral, n_colors + neutral_word, color_word)
+    color = np.select(
+        [condition == CONDITIONS.index("Congruent"), neutral],
+        [color_word, free_color],
+        (color_word + offset) % n_colors
+    )
+
+    return {
+        "word": word.astype(np.int8),
+        "color": color.astype(np.int8),
+        "condition": condition.astype(np.int8),
+    }
+
+
+def sequence_trials(sequences, index=0):
+
+    return [
+        (WORDS[w], COLOR_VALUES[c], CONDITIONS[k])
+        for w, c, k in zip(
+            sequences["word"][index].tolist(),
+            sequences["color"][index].tolist(),
+            sequences["condition"][index].tolist(),
+        )
+    ]
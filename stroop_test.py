@@ -1,92 +1,160 @@
 import streamlit as st
-import random
-import time
+import numpy as np
 import pandas as pd
-from streamlit_autorefresh import st_autorefresh
 
-TOTAL_QUESTIONS = 42
-TIME_LIMIT = 5
-
-COLORS = {
-    "RED": "red",
-    "GREEN": "green",
-    "BLUE": "blue",
-    "YELLOW": "yellow"
-}
-
-NEUTRAL_WORDS = ["DOG", "CAR", "TREE", "HOUSE"]
-
-
-# ================= QUESTION ENGINE =================
-
-def generate_question():
-    q_type = random.choice(["congruent", "incongruent", "neutral"])
-
-    if q_type == "neutral":
-        word = random.choice(NEUTRAL_WORDS)
-        color = random.choice(list(COLORS.values()))
-        return word, color, "Neutral"
-
-    word = random.choice(list(COLORS.keys()))
-
-    if q_type == "congruent":
-        color = COLORS[word]
-        condition = "Congruent"
-    else:
-        color = random.choice([c for c in COLORS.values() if c != COLORS[word]])
-        condition = "Incongruent"
+from question_bank import load_question_bank
+from scoring import score_stroop, session_scores
+from stage_state import StroopState
+from stroop_questions import COLOR_VALUES, COLORS, CONDITIONS, TOTAL_QUESTIONS, WORDS
+from timing import CLIENT_TIMING, stroop_runner
+from trial_engine import TrialTask, choice_buttons, run_task
 
-    return word, color, condition
-
-
-def record_response(results, q_no, word, color, condition, answer, correct, rt):
-    results.append({
-        "Question": q_no,
-        "Word": word,
-        "Font Color": color,
-        "Condition": condition,
-        "Response": answer if answer else "No Response",
-        "Correct": correct,
-        "Reaction Time (s)": rt
-    })
+TIME_LIMIT = 5
 
 
-def next_question():
-    st.session_state.q_index += 1
-    st.session_state.start_time = time.time()
-    st.session_state.answered = False
+# ================= TRIAL BUFFER =================
 
-    (
-        st.session_state.word,
-        st.session_state.color,
-        st.session_state.condition
-    ) = generate_question()
+RESPONSES = tuple(COLORS.keys())
 
+_WORD_CODES = {w: i for i, w in enumerate(WORDS)}
+_COLOR_CODES = {c: i for i, c in enumerate(COLOR_VALUES)}
+_CONDITION_CODES = {c: i for i, c in enumerate(CONDITIONS)}
+_RESPONSE_CODES = {r: i for i, r in enumerate(RESPONSES)}
 
-# ================= MAIN ENGINE =================
+NO_RESPONSE = -1
 
-def run_stroop_test():
 
-    st.title("🧠 Stroop Color–Word Test")
+class TrialBuffer:
 
-    # -------- SESSION INIT --------
+    # Fixed-size columns, one slot per trial. Words, colours, conditions and
+    # responses are stored as int8 codes; a missed trial has response -1 and
+    # a NaN reaction time. client_rt and latency stay NaN unless client-side
+    # timing is enabled.
 
-    if "stroop_started" not in st.session_state:
-        st.session_state.stroop_started = False
+    __slots__ = (
+        "count", "question", "word", "color", "condition", "response", "correct",
+        "rt", "client_rt", "latency"
+    )
 
-    if "q_index" not in st.session_state:
-        st.session_state.q_index = 1
+    def __init__(self, size=TOTAL_QUESTIONS):
+        self.count = 0
+        self.question = np.zeros(size, dtype=np.int16)
+        self.word = np.zeros(size, dtype=np.int8)
+        self.color = np.zeros(size, dtype=np.int8)
+        self.condition = np.zeros(size, dtype=np.int8)
+        self.response = np.full(size, NO_RESPONSE, dtype=np.int8)
+        self.correct = np.zeros(size, dtype=bool)
+        self.rt = np.full(size, np.nan, dtype=np.float64)
+        self.client_rt = np.full(size, np.nan, dtype=np.float64)
+        self.latency = np.full(size, np.nan, dtype=np.float64)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, q_no, word, color, condition, answer, correct, rt, client_rt=None, latency=None):
+        i = self.count
+        self.question[i] = q_no
+        self.word[i] = _WORD_CODES[word]
+        self.color[i] = _COLOR_CODES[color]
+        self.condition[i] = _CONDITION_CODES[condition]
+        self.response[i] = _RESPONSE_CODES[answer] if answer else NO_RESPONSE
+        self.correct[i] = correct
+        self.rt[i] = np.nan if rt is None else rt
+        self.client_rt[i] = np.nan if client_rt is None else client_rt
+        self.latency[i] = np.nan if latency is None else latency
+        self.count += 1
+
+    def summary(self):
+        n = self.count
+        return session_scores(score_stroop(
+            np.zeros(n, dtype=np.int64),
+            self.condition[:n],
+            self.correct[:n],
+            self.rt[:n],
+            n_sessions=1
+        ))
+
+    def to_frame(self):
+
+        n = self.count
+        response = self.response[:n]
+
+        frame = pd.DataFrame({
+            "Question": self.question[:n],
+            "Word": np.array(WORDS)[self.word[:n]],
+            "Font Color": np.array(COLOR_VALUES)[self.color[:n]],
+            "Condition": np.array(CONDITIONS)[self.condition[:n]],
+            "Response": np.where(response == NO_RESPONSE, "No Response", np.array(RESPONSES)[response]),
+            "Correct": self.correct[:n],
+            "Reaction Time (s)": self.rt[:n],
+        })
+
+        if CLIENT_TIMING:
+            frame["Client-Server Latency (s)"] = self.latency[:n]
+
+        return frame
+
+
+# ================= TASK =================
+
+class StroopTask(TrialTask):
+
+    stage = "stroop"
+    title = "🧠 Stroop Color–Word Test"
+    start_label = "▶️ Start Test"
+    continue_label = "Continue to Mental Rotation Test"
+    next_stage = "mental"
+    total_trials = TOTAL_QUESTIONS
+
+    @property
+    def time_limit(self):
+        return TIME_LIMIT
+
+    # ---------- STATE AND STIMULI ----------
+
+    def new_state(self, bank_index):
+        return StroopState(TrialBuffer())
+
+    def on_start(self, state, bank_index):
+
+        # Trials come from the session's precomputed sequence.
+
+        state.results = TrialBuffer()
+        state.trials = load_question_bank().stroop_trials(bank_index)
+
+    def stimulus(self, state):
+        return state.trials[state.trial]
+
+    # ---------- SCORING ----------
+
+    def parse_response(self, raw):
+        if raw not in RESPONSES:
+            raise ValueError(f"Not a response button: {raw!r}")
+        return raw
+
+    def score(self, trial, response):
+        return response.lower() == trial[1]
+
+    def collect(self, state, trial, response, correct, rt, timing):
+        word, color, condition = trial
+        state.results.append(
+            state.trial + 1, word, color, condition, response, correct, rt,
+            timing.get("client_rt"), timing.get("latency")
+        )
 
-    if "results" not in st.session_state:
-        st.session_state.results = []
+    def trial_record(self, trial, response):
+        word, color, condition = trial
+        return {"stimulus": f"{word}:{color}", "condition": condition, "response": response}
 
-    if "answered" not in st.session_state:
-        st.session_state.answered = False
+    def summary(self, state):
+        return state.results.summary()
 
-    # -------- START --------
+    def carry_score(self, summary):
+        return summary["stroop_effect"]
 
-    if not st.session_state.stroop_started:
+    # ---------- RENDERING ----------
 
+    def render_intro(self, state):
         st.subheader("📋 Instructions")
         st.write("""
 - Select the COLOR of the text, not the word.
@@ -95,55 +163,35 @@ def run_stroop_test():
 - Total questions: 42
 """)
 
-        if st.button("▶️ Start Test"):
-
-            st.session_state.stroop_started = True
-            st.session_state.q_index = 1
-            st.session_state.results = []
-            st.session_state.start_time = time.time()
-
-            (
-                st.session_state.word,
-                st.session_state.color,
-                st.session_state.condition
-            ) = generate_question()
+    def render_trial(self, state, trial):
 
-            st.session_state.answered = False
-            st.rerun()
+        word, color, _ = trial
 
-        return
+        st.markdown(
+            f"<h1 style='color:{color}; text-align:center;'>"
+            f"{word}</h1>",
+            unsafe_allow_html=True
+        )
 
-    # -------- FINISH --------
+        return choice_buttons(self, state, RESPONSES)
 
-    if st.session_state.q_index > TOTAL_QUESTIONS:
+    def render_summary(self, state, summary):
 
         st.success("✅ Test Completed")
 
-        df = pd.DataFrame(st.session_state.results)
-
-        total_trials = len(df)
-        total_errors = total_trials - df["Correct"].sum()
-        error_rate = (total_errors / total_trials) * 100 if total_trials > 0 else 0
-
-        df_correct = df[df["Correct"] == True]
-
-        mean_rt = df_correct["Reaction Time (s)"].dropna().mean()
-
-        cong_rt = df_correct[df_correct["Condition"] == "Congruent"]["Reaction Time (s)"].mean()
-        incong_rt = df_correct[df_correct["Condition"] == "Incongruent"]["Reaction Time (s)"].mean()
-
-        stroop_effect = None
-        if pd.notna(cong_rt) and pd.notna(incong_rt):
-            stroop_effect = incong_rt - cong_rt
+        mean_rt = summary["mean_rt"]
+        stroop_effect = summary["stroop_effect"]
 
         st.subheader("📊 Performance Metrics")
 
         col1, col2, col3 = st.columns(3)
 
-        col1.metric("Error Rate (%)", f"{error_rate:.2f}")
-        col2.metric("Mean RT (Correct Only) (s)", f"{mean_rt:.2f}" if pd.notna(mean_rt) else "N/A")
+        col1.metric("Error Rate (%)", f"{summary['error_rate']:.2f}")
+        col2.metric("Mean RT (Correct Only) (s)", f"{mean_rt:.2f}" if mean_rt is not None else "N/A")
         col3.metric("Stroop Interference (s)", f"{stroop_effect:.2f}" if stroop_effect is not None else "N/A")
 
+        df = state.results.to_frame()
+
         st.subheader("📋 Detailed Responses")
         st.dataframe(df, use_container_width=True)
 
@@ -154,83 +202,24 @@ def run_stroop_test():
             "text/csv"
         )
 
-        if st.button("Continue to Mental Rotation Test"):
-
-            for key in [
-                "stroop_started",
-                "q_index",
-                "results",
-                "answered",
-                "word",
-                "color",
-                "condition",
-                "start_time"
-            ]:
-                st.session_state.pop(key, None)
+    def run_block(self, state):
 
-            st.session_state.current_stage = "mental"
-            st.rerun()
+        # The whole block in the browser (stroop_runner); only choices it
+        # knows about are taken as responses.
 
-        return
-
-    # -------- TIMER (STABLE) --------
-
-    st_autorefresh(interval=1000, key="stroop_timer")
-
-    elapsed = time.time() - st.session_state.start_time
-    remaining = max(0, int(TIME_LIMIT - elapsed))
-
-    st.write(f"### Question {st.session_state.q_index} / {TOTAL_QUESTIONS}")
-    st.warning(f"⏱ Time left: {remaining} seconds")
+        results = stroop_runner(
+            state.trials, RESPONSES, TIME_LIMIT,
+            run=st.session_state.session_id, key="stroop_runner"
+        )
 
-    # -------- DISPLAY --------
+        if results is None or len(results) != TOTAL_QUESTIONS:
+            return None
 
-    st.markdown(
-        f"<h1 style='color:{st.session_state.color}; text-align:center;'>"
-        f"{st.session_state.word}</h1>",
-        unsafe_allow_html=True
-    )
+        return [
+            (r.get("choice") if r.get("choice") in RESPONSES else None, r.get("client_rt"))
+            for r in results
+        ]
 
-    # -------- ANSWERS --------
-
-    cols = st.columns(4)
-
-    for color_name, col in zip(COLORS.keys(), cols):
-        with col:
-            if st.button(color_name, key=f"{st.session_state.q_index}_{color_name}") and not st.session_state.answered:
-
-                rt = round(elapsed, 2)
-                correct = color_name.lower() == st.session_state.color
-
-                record_response(
-                    st.session_state.results,
-                    st.session_state.q_index,
-                    st.session_state.word,
-                    st.session_state.color,
-                    st.session_state.condition,
-                    color_name,
-                    correct,
-                    rt
-                )
-
-                st.session_state.answered = True
-                next_question()
-                st.rerun()
-
-    # -------- TIMEOUT --------
-
-    if remaining == 0 and not st.session_state.answered:
-
-        record_response(
-            st.session_state.results,
-            st.session_state.q_index,
-            st.session_state.word,
-            st.session_state.color,
-            st.session_state.condition,
-            None,
-            False,
-            None
-        )
 
-        next_question()
-        st.rerun()
+def run_stroop_test():
+    run_task(StroopTask())
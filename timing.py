@@ -0,0 +1,184 @@
+import os
+import time
+
+import streamlit.components.v1 as components
+from streamlit_autorefresh import st_autorefresh
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Also capture performance.now() in the browser for every response, via
+# the timed_buttons component, alongside the server-side timestamps.
+CLIENT_TIMING = os.environ.get("RP_CLIENT_TIMING", "0") == "1"
+
+# Run whole blocks of trials in the browser (see the runner components):
+# one script run to start a block and one to receive its results.
+CLIENT_RUNNERS = os.environ.get("RP_CLIENT_RUNNERS", "0") == "1"
+
+# Grace added to every scheduled wake-up so the rerun lands just after the
+# deadline on the server clock, not a few milliseconds before it.
+RERUN_SLACK_MS = 50
+
+
+# ================= SERVER CLOCK =================
+
+# All trial timestamps are perf_counter_ns readings: monotonic, and with
+# nanosecond resolution. They are only meaningful as differences.
+
+def now_ns():
+    return time.perf_counter_ns()
+
+
+def response_timing(onset_ns, client=None, response_ns=None):
+
+    # Server RT runs from onset_ns, the moment the previous trial ended (or
+    # the task started) in the script run that queued the rerun drawing this
+    # stimulus, to the script run that received the response; it includes
+    # that rerun. With a client reading as well, RT is taken from the
+    # browser and the difference is the round-trip and rerun latency that
+    # the server measurement carried. response_ns defaults to now;
+    # simulations pass their own clock reading.
+
+    if response_ns is None:
+        response_ns = now_ns()
+    server_rt = (response_ns - onset_ns) / 1e9
+    client_rt = client.get("client_rt") if client else None
+
+    return {
+        "onset_ns": onset_ns,
+        "response_ns": response_ns,
+        "rt": client_rt if client_rt is not None else server_rt,
+        "client_rt": client_rt,
+        "latency": server_rt - client_rt if client_rt is not None else None,
+    }
+
+
+# ================= CLIENT RESPONSE CAPTURE =================
+
+_timed_buttons = components.declare_component(
+    "timed_buttons", path=os.path.join(BASE_DIR, "components", "timed_buttons")
+)
+
+
+def timed_buttons(options, trial, key):
+
+    # A row of response buttons rendered in the browser. Returns None until
+    # one is clicked for this trial, then the choice with its
+    # performance.now() onset/response stamps (ms) and client_rt (s).
+
+    value = _timed_buttons(options=list(options), trial=trial, key=key, default=None)
+
+    if value is None or value.get("trial") != trial:
+        return None
+
+    return value
+
+
+# ================= CLIENT TRIAL RUNNERS =================
+
+_stroop_runner = components.declare_component(
+    "stroop_runner", path=os.path.join(BASE_DIR, "components", "stroop_runner")
+)
+
+
+def stroop_runner(trials, responses, time_limit, run, key):
+
+    # Presents every (word, colour, condition) trial in the browser with its
+    # time limit. Returns None until the block is over, then one result per
+    # trial: the choice (None on timeout) with performance.now() stamps (ms)
+    # and client_rt (s).
+
+    value = _stroop_runner(
+        trials=[[word, color] for word, color, _ in trials],
+        responses=list(responses),
+        time_limit=time_limit,
+        run=run,
+        key=key,
+        default=None
+    )
+
+    if value is None or value.get("run") != run:
+        return None
+
+    return value["results"]
+
+
+_mrt_runner = components.declare_component(
+    "mrt_runner", path=os.path.join(BASE_DIR, "components", "mrt_runner")
+)
+
+
+def mrt_runner(trials, images, time_limit, run, key):
+
+    # trials: (target, (option A, option B)) image paths; images: path ->
+    # data URI, covering every path used. Returns None until the block is
+    # over, then one result per trial: choice "A", "B" or None on timeout,
+    # with performance.now() stamps (ms) and client_rt (s).
+
+    value = _mrt_runner(
+        trials=[{"target": target, "options": list(options)} for target, options in trials],
+        images=images,
+        time_limit=time_limit,
+        run=run,
+        key=key,
+        default=None
+    )
+
+    if value is None or value.get("run") != run:
+        return None
+
+    return value["results"]
+
+
+# ================= DEADLINE RERUN =================
+
+def schedule_rerun(remaining, key, tick_rate=None):
+
+    # A single client-side timer, re-armed on every render. Without a tick
+    # rate it fires once, when the deadline passes, so an idle session costs
+    # no script runs at all while it waits.
+
+    interval_ms = int(max(0.0, remaining) * 1000) + RERUN_SLACK_MS
+
+    if tick_rate:
+        interval_ms = min(interval_ms, int(1000 / tick_rate))
+
+    st_autorefresh(interval=max(1, interval_ms), key=key)
+
+
+# ================= CLIENT COUNTDOWN =================
+
+_countdown = components.declare_component(
+    "countdown", path=os.path.join(BASE_DIR, "components", "countdown")
+)
+
+
+def render_countdown(remaining, label="⏳ Time Remaining", key="countdown"):
+
+    # Ticks in the browser only; the server never reruns to redraw it. The
+    # stable key keeps one iframe, which restarts from each new reading.
+
+    _countdown(
+        remaining_ms=int(max(0.0, remaining) * 1000),
+        label=label,
+        key=key,
+        default=None
+    )
+
+
+# ================= CLIENT TIME BAR =================
+
+_time_bar = components.declare_component(
+    "time_bar", path=os.path.join(BASE_DIR, "components", "time_bar")
+)
+
+
+def render_time_bar(remaining, total, key="time_bar"):
+
+    # Browser-side equivalent of st.progress for per-trial time limits.
+
+    _time_bar(
+        remaining_ms=int(max(0.0, remaining) * 1000),
+        total_ms=int(total * 1000),
+        key=key,
+        default=None
+    )
@@ -0,0 +1,392 @@
+import time
+
+import streamlit as st
+
+from monitor import get_monitor
+from results_store import get_results_store
+from stage_state import advance_stage, stage_state
+from state_backend import checkpoint, load_checkpoint
+from timing import (
+    CLIENT_RUNNERS, CLIENT_TIMING, now_ns, render_countdown, render_time_bar,
+    response_timing, schedule_rerun, timed_buttons
+)
+
+# Every test is a TrialTask plugin run by one scheduler, run_task(). The
+# task says what a trial is, how a response is scored and what its time
+# limits are; the scheduler owns starting, timing, timeouts, refresh,
+# recording, the summary and the hand-over to the next stage.
+#
+# The step functions (start, remaining, finished, apply_response,
+# apply_timeout, apply_block) change only the state object and report
+# trials through a recorder callback, with the clock passed in, so they run
+# just as well outside Streamlit. Each one is checkpointed as it happens,
+# and replay() re-applies the checkpoints to rebuild a lost state.
+
+
+# ================= TASK INTERFACE =================
+
+class TrialTask:
+
+    stage = None            # stage name, and by default the results "test"
+    title = None
+    start_label = None      # None starts the task straight away
+    continue_label = "Continue"
+    continue_options = {}   # extra st.button arguments for Continue
+    next_stage = None
+
+    total_trials = None     # None: unlimited, until block_limit runs out
+    time_limit = None       # seconds per trial, or None
+    block_limit = None      # seconds for the whole task, or None
+    timeout_rt = None       # rt stored for a timed-out trial
+    tick_rate = None        # see timing.schedule_rerun
+
+    @property
+    def test(self):
+        # The "test" that trials and the summary are stored under.
+        return self.stage
+
+    # ---------- STATE AND STIMULI ----------
+
+    def new_state(self, bank_index):
+        raise NotImplementedError
+
+    def on_start(self, state, bank_index):
+        pass
+
+    def stimulus(self, state):
+        # The trial at state.trial.
+        raise NotImplementedError
+
+    # ---------- SCORING ----------
+
+    def parse_response(self, raw):
+        # The response as scored, from what the participant entered; raises
+        # ValueError for input that is rejected without using up the trial.
+        return raw
+
+    def score(self, trial, response):
+        # True / False, or None when the response is not scored (a skip).
+        raise NotImplementedError
+
+    def collect(self, state, trial, response, correct, rt, timing):
+        # Keep whatever the summary needs from one finished trial.
+        pass
+
+    def trial_record(self, trial, response):
+        # stimulus / condition / response columns for the results store.
+        raise NotImplementedError
+
+    def advance(self, state, correct):
+        pass
+
+    def summary(self, state):
+        raise NotImplementedError
+
+    def carry_score(self, summary):
+        # The one number kept in st.session_state.scores after the stage.
+        return None
+
+    # ---------- RENDERING ----------
+
+    def render_intro(self, state):
+        pass
+
+    def progress_label(self, state):
+        return f"### Question {state.trial + 1} / {self.total_trials}"
+
+    def render_trial(self, state, trial):
+        # Draw the stimulus and the response controls; return the response
+        # and its client timing as (response, client), or None.
+        raise NotImplementedError
+
+    def render_summary(self, state, summary):
+        pass
+
+    def run_block(self, state):
+        # Optional browser-side runner for the whole block: None while it
+        # runs, then one (response, client_rt) per trial, response None on a
+        # timeout. Tasks without one always run trial by trial.
+        return NotImplemented
+
+
+# ================= STEPS =================
+
+def start(task, state, bank_index, onset_ns, wall_time):
+    state.started = True
+    state.trial = 0
+    state.onset_ns = onset_ns
+    state.started_at = wall_time
+    task.on_start(state, bank_index)
+
+
+def remaining(task, state, clock_ns, wall_time):
+
+    # Seconds left before the nearer of the trial and block limits, and
+    # which of the two it is.
+
+    left, kind = None, None
+
+    if task.time_limit is not None:
+        left, kind = task.time_limit - (clock_ns - state.onset_ns) / 1e9, "trial"
+
+    if task.block_limit is not None:
+        block_left = task.block_limit - max(0.0, wall_time - state.started_at)
+        if left is None or block_left <= left:
+            left, kind = block_left, "block"
+
+    return left, kind
+
+
+def finished(task, state, wall_time):
+
+    if task.total_trials is not None and state.trial >= task.total_trials:
+        return True
+
+    return (
+        task.block_limit is not None
+        and wall_time - state.started_at >= task.block_limit
+    )
+
+
+def _record(task, state, recorder, trial, response, correct, rt, timing, timed_out):
+    task.collect(state, trial, response, correct, rt, timing)
+    recorder(
+        task.test, state.trial + 1,
+        **task.trial_record(trial, response),
+        correct=correct, rt=rt, timed_out=timed_out,
+        onset_ns=timing.get("onset_ns"), response_ns=timing.get("response_ns"),
+        client_rt=timing.get("client_rt"), latency=timing.get("latency")
+    )
+
+
+def _next(task, state, correct, onset_ns):
+    task.advance(state, correct)
+    state.trial += 1
+    state.onset_ns = onset_ns
+
+
+def apply_response(task, state, recorder, response, timing):
+
+    trial = task.stimulus(state)
+    correct = task.score(trial, response)
+
+    _record(task, state, recorder, trial, response, correct, timing["rt"], timing, False)
+    _next(task, state, bool(correct), timing["response_ns"])
+
+
+def apply_timeout(task, state, recorder, clock_ns):
+
+    trial = task.stimulus(state)
+
+    _record(task, state, recorder, trial, None, False, task.timeout_rt, {"onset_ns": state.onset_ns}, True)
+    _next(task, state, False, clock_ns)
+
+
+def _in_time(task, client_rt):
+    if isinstance(client_rt, bool) or not isinstance(client_rt, (int, float)):
+        return False
+    return 0 <= client_rt and (task.time_limit is None or client_rt <= task.time_limit)
+
+
+def _parsed(task, response):
+    if response is None:
+        return None
+    try:
+        return task.parse_response(response)
+    except (TypeError, ValueError):
+        return None
+
+
+def apply_block(task, state, recorder, results):
+
+    # Results of a block the browser ran. Only the choices and client RTs
+    # come from there; trials and scoring are the server's own, and so is
+    # the time limit: a response outside it, with a negative RT or not one
+    # the task accepts counts as a timeout.
+
+    for response, client_rt in results:
+        if not _in_time(task, client_rt) or _parsed(task, response) is None:
+            apply_timeout(task, state, recorder, None)
+        else:
+            timing = {"onset_ns": None, "response_ns": None, "rt": client_rt, "client_rt": client_rt}
+            apply_response(task, state, recorder, response, timing)
+
+
+def _discard(test, trial, **fields):
+    pass
+
+
+def replay(task, entries):
+
+    # Checkpoint entries are ("start", state) followed by one ("response",
+    # response, timing, used), ("timeout", used) or ("block", results, used)
+    # per step, where `used` is the block time spent when it happened.
+    # Returns the state after the last step and that time; the steps were
+    # recorded when they first happened, so nothing is recorded again.
+
+    _, state = entries[0]
+    used = 0.0
+
+    for kind, *args in entries[1:]:
+        if kind == "response":
+            response, timing, used = args
+            apply_response(task, state, _discard, response, timing)
+        elif kind == "timeout":
+            used, = args
+            apply_timeout(task, state, _discard, None)
+        elif kind == "block":
+            results, used = args
+            apply_block(task, state, _discard, results)
+
+    return state, used
+
+
+# ================= STREAMLIT SCHEDULER =================
+
+def store_recorder():
+
+    store = get_results_store()
+    monitor = get_monitor()
+    session_id = st.session_state.session_id
+    stage = st.session_state.current_stage
+
+    def record(test, trial, **fields):
+        store.record_trial(session_id, test, trial, **fields)
+        monitor.trial(session_id, stage, trial, fields.get("rt"), fields.get("timed_out", False))
+
+    return record
+
+
+def resume_state(task, bank_index):
+
+    # A task's state when its session has none: rebuilt from checkpoints
+    # if the task was under way before a reconnect or worker restart, new
+    # otherwise. The trial in progress starts again; the block clock carries
+    # on from the time used at the last checkpoint.
+
+    entries = load_checkpoint(task.stage)
+
+    if not entries:
+        return task.new_state(bank_index)
+
+    state, used = replay(task, entries)
+    state.onset_ns = now_ns()
+    state.started_at = time.time() - used
+
+    return state
+
+
+def _checkpoint_step(task, state, kind, *args):
+    checkpoint(task.stage, (kind, *args, time.time() - state.started_at))
+
+
+def choice_buttons(task, state, labels):
+
+    # One row of response buttons; with client timing they are drawn and
+    # timed in the browser. Returns (label, client) once one is pressed. The
+    # key stays the same across trials, so one iframe redraws its buttons
+    # for each new trial instead of a fresh iframe loading every time.
+
+    if CLIENT_TIMING:
+        click = timed_buttons(labels, trial=state.trial, key=f"{task.stage}_response")
+        return (click["choice"], click) if click else None
+
+    for label, col in zip(labels, st.columns(len(labels))):
+        with col:
+            if st.button(label, key=f"{task.stage}_{state.trial}_{label}"):
+                return label, None
+
+    return None
+
+
+def run_task(task):
+
+    st.title(task.title)
+
+    bank_index = st.session_state.bank_index
+    state = stage_state(task.stage, lambda: resume_state(task, bank_index))
+
+    # ---------- START ----------
+
+    if not state.started:
+
+        if task.start_label is not None:
+            task.render_intro(state)
+
+            if st.button(task.start_label):
+                start(task, state, bank_index, now_ns(), time.time())
+                checkpoint(task.stage, ("start", state), reset=True)
+                st.rerun()
+
+            return
+
+        start(task, state, bank_index, now_ns(), time.time())
+        checkpoint(task.stage, ("start", state), reset=True)
+
+    # ---------- FINISH ----------
+
+    if finished(task, state, time.time()):
+
+        # Scored and queued for the store once; reruns on the summary
+        # screen only redraw it.
+
+        if state.summary is None:
+            state.summary = task.summary(state)
+            get_results_store().record_summary(st.session_state.session_id, task.test, state.summary)
+
+        summary = state.summary
+        task.render_summary(state, summary)
+
+        if st.button(task.continue_label, **task.continue_options):
+            advance_stage(task.next_stage, **{task.stage: task.carry_score(summary)})
+
+        return
+
+    # ---------- BROWSER-SIDE BLOCK ----------
+
+    if CLIENT_RUNNERS:
+        results = task.run_block(state)
+
+        if results is not NotImplemented:
+            if results is not None:
+                apply_block(task, state, store_recorder(), results)
+                _checkpoint_step(task, state, "block", results)
+                st.rerun()
+            return
+
+    # ---------- TIMER ----------
+
+    # Limits are checked on the server clock before any response is
+    # accepted; the browser animates the countdown and the script is woken
+    # once, at the next deadline (or at the task's tick rate).
+
+    left, kind = remaining(task, state, now_ns(), time.time())
+
+    if left is not None and left <= 0:
+        if kind == "trial":
+            apply_timeout(task, state, store_recorder(), now_ns())
+            _checkpoint_step(task, state, "timeout")
+        st.rerun()
+
+    if task.total_trials is not None:
+        st.markdown(task.progress_label(state))
+
+    if kind == "block":
+        render_countdown(left, key=f"{task.stage}_countdown")
+    elif kind == "trial":
+        render_time_bar(left, task.time_limit, key=f"{task.stage}_time_bar")
+
+    if left is not None:
+        schedule_rerun(left, key=f"{task.stage}_timer", tick_rate=task.tick_rate)
+
+    # ---------- TRIAL ----------
+
+    trial = task.stimulus(state)
+    answer = task.render_trial(state, trial)
+
+    if answer is not None:
+        response, client = answer
+        timing = response_timing(state.onset_ns, client)
+        apply_response(task, state, store_recorder(), response, timing)
+        _checkpoint_step(task, state, "response", response, timing)
+        st.rerun()